@@ -17,15 +17,21 @@ actions on taskcluster instead of being generic.
 import collections
 import contextlib
 import datetime
+import fnmatch
+import functools
+import hashlib
 import json
 import os
 import re
 import requests
+import shlex
 import subprocess
 import sys
+import tempfile
 from typing import Dict, List, Set, Optional, Tuple
 import taskcluster
 import gha
+import toolchains
 import utils
 import yaml
 
@@ -53,6 +59,27 @@ __all__ = [
 DEPLOY_BRANCHES = ["main", "master"]
 
 
+def deploys_enabled() -> bool:
+    """Whether deploy actions run, rather than being given `PAHKAT_NO_DEPLOY`"""
+    deploy_ref = CONFIG.git_ref.startswith("refs/tags/") or any(
+        CONFIG.git_ref == "refs/heads/%s" % branch for branch in DEPLOY_BRANCHES
+    )
+    return deploy_ref and "[no deploy]" not in CONFIG.commit_message
+
+
+@functools.lru_cache(maxsize=None)
+def remote_head(url: str, ref: str = "HEAD") -> str:
+    """Return the commit `ref` of the remote repository `url` points to"""
+    output = subprocess.check_output(["git", "ls-remote", url, ref])
+    return output.split()[0].decode()
+
+
+def normalize_git_url(url: str) -> str:
+    """Drop the trailing `.git` or `/` of `url`, which GitHub accepts either way"""
+    url = url.rstrip("/")
+    return url[: -len(".git")] if url.endswith(".git") else url
+
+
 class Config:
     """
     Global configuration, for users of the library to modify.
@@ -64,6 +91,29 @@ class Config:
         self.scopes_for_all_subtasks: List[str] = []
         self.routes_for_all_subtasks: List[str] = ["checks"]
         self.repacked_msi_files_expire_in = "1 month"
+        self.sccache_version = toolchains.SCCACHE_VERSION
+        self.sccache_cache_size = "10G"
+        self.cargo_ndk_version = "3.5.4"
+        # Node.js of the Linux tasks, which run the GitHub actions. Ubuntu's is
+        # too old for their `node20` runtime.
+        self.nodejs_version = "20.18.0"
+
+        # Persistent cache directories on the stateful generic-worker machines
+        self.macos_cache_root = "$HOME/divvun-caches"
+        self.windows_cache_root = "C:\\divvun-caches"
+        # Disk budget of the persistent cargo target directories, in GB
+        self.macos_cargo_target_cache_size = 60
+        self.docker_images_expire_in = "1 month"
+        # Repositories, as `fnmatch` patterns of their URL, that workers keep
+        # a mirror of for clones to borrow objects from. See `Task.git_mirror`.
+        # Mirrors have every blob, since clones borrowing from them expect
+        # to, so only the small repositories of the CI itself are listed.
+        # The repositories under test use blobless checkouts instead.
+        self.git_mirrored_repos: List[str] = [
+            "https://github.com/divvun/taskcluster-gha",
+        ]
+        if os.environ.get("CI_REPO_URL"):
+            self.git_mirrored_repos.append(normalize_git_url(os.environ["CI_REPO_URL"]))
 
         # Set by docker-worker:
         # https://docs.taskcluster.net/docs/reference/workers/docker-worker/docs/environment
@@ -83,6 +133,9 @@ class Config:
         self._tree_hash = None
         self._commit_message = None
         self._tc_config = None
+        self._changed_files: Dict[str, Optional[List[str]]] = {}
+        self._repo_trees: Dict[str, Set[str]] = {}
+        self._repo_bundle: Optional[str] = None
 
     def tree_hash(self) -> str:
         if self._tree_hash is None:
@@ -147,6 +200,126 @@ class Config:
 
         return self._tc_config
 
+    def repo_file(self, path: str) -> Optional[bytes]:
+        """
+        Fetch a single file of the repository at `git_sha` without cloning it.
+        Returns `None` if the file doesn't exist.
+        """
+        url = f"https://raw.githubusercontent.com/{os.environ['REPO_FULL_NAME']}/{self.git_sha}/{path}"
+        headers = {"Authorization": f"token {github_token()}"}
+        response = requests.get(url, headers=headers)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+
+
+    def repo_tree(self, sha: Optional[str] = None) -> Set[str]:
+        """
+        List the paths of every file of the repository at `sha`, `git_sha` by
+        default, without downloading their content. Results are cached per SHA.
+
+        Uses the Git trees API, and a blobless fetch when the tree is too
+        large for the API to return in full.
+        """
+        sha = sha or self.git_sha
+        if sha not in self._repo_trees:
+            url = f"https://api.github.com/repos/{os.environ['REPO_FULL_NAME']}/git/trees/{sha}?recursive=1"
+            headers = {
+                "Authorization": f"token {github_token()}",
+                "Accept": "application/vnd.github.v3+json",
+            }
+            response = requests.get(url, headers=headers)
+            response.raise_for_status()
+            tree = response.json()
+            if tree["truncated"]:
+                paths = self._fetch_repo_tree(sha)
+            else:
+                paths = {e["path"] for e in tree["tree"] if e["type"] == "blob"}
+            self._repo_trees[sha] = paths
+        return self._repo_trees[sha]
+
+    def _fetch_repo_tree(self, sha: str) -> Set[str]:
+        with tempfile.TemporaryDirectory() as repo:
+            subprocess.check_call(["git", "init", "-q", repo])
+            subprocess.check_call(
+                ["git", "fetch", "-q", "--depth=1", "--filter=blob:none", self.git_url, sha],
+                cwd=repo,
+            )
+            output = subprocess.check_output(
+                ["git", "ls-tree", "-r", "--name-only", "-z", "FETCH_HEAD"], cwd=repo
+            )
+        return set(output.decode("utf-8").split("\0")) - {""}
+
+    def repo_glob(self, pattern: str, sha: Optional[str] = None) -> List[str]:
+        """
+        Return the files of the repository matching `pattern`, see `repo_tree`.
+        The pattern is matched component by component with `fnmatch`, so that
+        unlike with `with_path_filter` a `*` does not match `/`.
+        """
+        parts = pattern.split("/")
+
+        def matches(path):
+            components = path.split("/")
+            return len(components) == len(parts) and all(
+                fnmatch.fnmatchcase(c, p) for c, p in zip(components, parts)
+            )
+
+        return sorted(filter(matches, self.repo_tree(sha)))
+
+    def repo_bundle(self) -> str:
+        """
+        Publish `git_sha`, without its history, as a `private/repo.bundle`
+        artifact of the decision task, and return the name to give to
+        `with_repo_bundle`. The bundle is only made once per decision task.
+        """
+        if self._repo_bundle is None:
+            with tempfile.TemporaryDirectory() as tmp:
+                repo = os.path.join(tmp, "repo")
+                subprocess.check_call(["git", "init", "-q", repo])
+                subprocess.check_call(
+                    ["git", "fetch", "-q", "--depth=1", self.git_url, self.git_sha],
+                    cwd=repo,
+                )
+                with make_repo_bundle(repo, "repo.bundle", self.git_sha):
+                    pass
+                with open(os.path.join(tmp, "repo.bundle"), "rb") as f:
+                    utils.create_extra_artifact("repo.bundle", f.read())
+            self._repo_bundle = "repo"
+        return self._repo_bundle
+
+    def changed_files(self, base_sha: str) -> Optional[List[str]]:
+        """
+        List the files changed between `base_sha` and `git_sha`, using the
+        GitHub compare API rather than a clone.
+
+        Returns `None` when that can't be known for sure, for example after a
+        force push or when the comparison is too large to be listed in full.
+        """
+        if base_sha not in self._changed_files:
+            url = f"https://api.github.com/repos/{os.environ['REPO_FULL_NAME']}/compare/{base_sha}...{self.git_sha}"
+            headers = {
+                "Authorization": f"token {github_token()}",
+                "Accept": "application/vnd.github.v3+json",
+            }
+            response = requests.get(url, headers=headers)
+            files = None
+            if response.ok:
+                comparison = response.json()
+                # The API lists at most 300 files
+                if comparison["status"] in ("ahead", "identical") and len(
+                    comparison.get("files", [])
+                ) < 300:
+                    files = [f["filename"] for f in comparison.get("files", [])]
+                    # Renames also affect their previous location
+                    files += [
+                        f["previous_filename"]
+                        for f in comparison.get("files", [])
+                        if "previous_filename" in f
+                    ]
+            self._changed_files[base_sha] = files
+        return self._changed_files[base_sha]
+
 
 class Shared:
     """
@@ -233,7 +406,9 @@ class Task:
         }
         self.scripts: List[str] = []
         self.late_scripts: List[str] = []
+        self.path_filters: List[str] = []
         self.action_paths: Set[str] = set()
+        self.git_mirrors: Set[str] = set()
         self.gh_actions: collections.OrderedDict[
             str, gha.GithubAction
         ] = collections.OrderedDict()
@@ -256,6 +431,76 @@ class Task:
     with_extra = chaining(update_attr, "extra")
     with_env = chaining(update_attr, "env")
 
+    def with_path_filter(self, *patterns: str):
+        """
+        Only run this task again if a file matching one of `patterns` changed
+        since the last successful run of the same task on this branch, and
+        otherwise reuse that run.
+
+        Patterns are `fnmatch` patterns relative to the repository root,
+        where `*` also matches `/`. A pattern starting with `!` excludes the
+        files it matches. Including `[ci full]` in the commit message
+        runs every task regardless. Inputs from outside the repository are
+        compared too, see `reuse_key`.
+        """
+        self.path_filters.extend(patterns)
+        return self
+
+    def is_affected(self, changed_files: List[str]) -> bool:
+        include = [p for p in self.path_filters if not p.startswith("!")]
+        exclude = [p[1:] for p in self.path_filters if p.startswith("!")]
+        return any(
+            any(fnmatch.fnmatchcase(path, p) for p in include)
+            and not any(fnmatch.fnmatchcase(path, p) for p in exclude)
+            for path in changed_files
+        )
+
+    def reuse_key(self) -> str:
+        """
+        Hash of what this task depends on besides the files of the repository
+        under test: the tasks it depends on or reads outputs from, and the
+        commits of the CI repository and of the actions it runs. A previous
+        run is only reused if it had the same key.
+        """
+        inputs = sorted(
+            set(self.dependencies).union(
+                *(action.outputs_from for action in self.gh_actions.values())
+            )
+            - {CONFIG.decision_task_id}
+        )
+        repos = {(os.environ["CI_REPO_URL"], os.environ["CI_REPO_REF"])}
+        for action in self.gh_actions.values():
+            if action.git_fetch_url:
+                repos.add((action.git_fetch_url, action.branch or "HEAD"))
+        inputs += [f"{url}@{remote_head(url, ref)}" for url, ref in sorted(repos)]
+        return hashlib.sha256("\n".join(inputs).encode()).hexdigest()
+
+    def find_unaffected(self, latest_index_path: str) -> Optional[str]:
+        """
+        Return the ID of the last successful run of this task, indexed at
+        `latest_index_path`, if none of the files it depends on changed since
+        and it had the same `reuse_key`.
+        """
+        if CONFIG.index_read_only or "[ci full]" in CONFIG.commit_message:
+            return None
+        try:
+            task_id = Task.find(latest_index_path)
+        except taskcluster.TaskclusterRestFailure as e:
+            if e.status_code != 404:  # pragma: no cover
+                raise
+            return None
+
+        extra = SHARED.queue_service.task(task_id).get("extra", {}).get("divvun", {})
+        base_sha = extra.get("git-sha")
+        if base_sha is None or extra.get("reuse-key") != self.reuse_key():
+            return None
+        changed_files = CONFIG.changed_files(base_sha)
+        if changed_files is None or self.is_affected(changed_files):
+            return None
+
+        print(f"Reusing {task_id} for {self.name}, unaffected since {base_sha}")
+        return task_id
+
     def with_scopes(self, *scopes):
         for scope in scopes:
             if CONFIG.index_read_only and scope.startswith("secrets"):
@@ -310,6 +555,9 @@ class Task:
     def with_named_artifacts(self, name: str, path: str):
         raise NotImplementedError
 
+    def with_sccache(self, key: str, max_size: Optional[str] = None):
+        raise NotImplementedError
+
     def build_worker_payload(self):  # pragma: no cover
         """
         Overridden by sub-classes to return a dictionary in a worker-specific format,
@@ -394,7 +642,7 @@ class Task:
             },
         )
 
-    def find_or_create(self, index_path: str) -> str:
+    def find_or_create(self, index_path: str, *, per_decision=True) -> str:
         """
         Try to find a task in the Index and return its ID.
 
@@ -405,13 +653,35 @@ class Task:
         If no task is found in the index,
         it is created with a route to add it to the index at that same path if it succeeds.
 
+        By default the decision task ID is appended to `index_path`, so tasks are
+        only shared within a decision task. With `per_decision=False`, `index_path`
+        is used as is and the task is reused by later decision tasks. `index_path`
+        must then describe everything the task depends on, a content hash for example.
+
+        Tasks with path filters (see `with_path_filter`) may instead reuse the
+        last successful run of the same repository, see `latest_index_path`.
+
         <https://docs.taskcluster.net/docs/reference/core/taskcluster-index/references/api#findTask>
         """
-        index_path += "." + CONFIG.decision_task_id
+        latest_path = latest_index_path(index_path)
+        if per_decision:
+            index_path += "." + CONFIG.decision_task_id
         task_id = SHARED.found_or_created_indexed_tasks.get(index_path)
         if task_id is not None:
             return task_id
 
+        if self.path_filters and per_decision:
+            task_id = self.find_unaffected(latest_path)
+            if task_id is not None:
+                SHARED.found_or_created_indexed_tasks[index_path] = task_id
+                return task_id
+            if not CONFIG.index_read_only:
+                # Indexed on success, as the base of the next comparison
+                self.with_index_at(latest_path)
+                self.with_extra(
+                    divvun={"git-sha": CONFIG.git_sha, "reuse-key": self.reuse_key()}
+                )
+
         if self.gh_actions:
             self.with_prep_gha_tasks()
 
@@ -422,8 +692,12 @@ class Task:
         except taskcluster.TaskclusterRestFailure as e:
             if e.status_code != 404:  # pragma: no cover
                 raise
+            if not per_decision and not CONFIG.index_read_only:
+                # Only index shared tasks once they succeed, a failed run
+                # would otherwise be reused by every later decision task.
+                self.with_index_at(index_path)
             task_id = self.create()
-            if not CONFIG.index_read_only:
+            if per_decision and not CONFIG.index_read_only:
                 self.create_index_at(index_path, task_id)
 
         SHARED.found_or_created_indexed_tasks[index_path] = task_id
@@ -439,6 +713,10 @@ class Task:
         if branch is not None:
             extra = f"--branch={branch}"
 
+        mirror = self.git_mirror(repo_url)
+        if mirror is not None:
+            extra += f" --reference-if-able {mirror}"
+
         return self.with_script(
             """
             git clone --depth=1 %s %s %s
@@ -446,6 +724,41 @@ class Task:
             % (repo_url, target, extra)
         )
 
+    def git_mirror(self, repo_url: str) -> Optional[str]:
+        """
+        If `repo_url` is one of `CONFIG.git_mirrored_repos`, update the worker's
+        mirror of it and return its path, so that clones can borrow its objects
+        and only download what it is missing.
+
+        Mirrors are fetched into by concurrent tasks, relying on git's own
+        locking: objects are written atomically, and a failed fetch only leaves
+        the mirror out of date. They are never garbage collected, so that
+        objects borrowed by running tasks don't disappear.
+        """
+        url = normalize_git_url(repo_url)
+        if not any(fnmatch.fnmatch(url, p) for p in CONFIG.git_mirrored_repos):
+            return None
+        path = self.git_mirror_path(url)
+        if url not in self.git_mirrors:
+            self.git_mirrors.add(url)
+            self.with_script(self.git_mirror_script(url, path))
+        return path
+
+    def git_mirror_path(self, url: str) -> str:
+        raise NotImplementedError
+
+    def git_mirror_script(self, url: str, path: str) -> str:
+        raise NotImplementedError
+
+    def with_borrowed_objects(self, path: str, repo_url: str):
+        """
+        Create an empty repository at `path`, with `repo_url` as its `origin`,
+        that borrows the objects of the worker's mirror of `repo_url`, if any.
+        `actions/checkout` with `clean: false` then only fetches what the mirror
+        is missing into it.
+        """
+        raise NotImplementedError
+
     def with_curl_script(self, url: str, file_path: str, as_gha=False):
         return self.with_script(
             """
@@ -465,18 +778,41 @@ class Task:
         extract=False,
         as_gha=False,
     ):
+        """
+        Download `artifact_name` of `task_id` into `out_directory`.
+
+        With `extract`, the archive is extracted into `out_directory`, or the
+        current directory, instead. On Linux and macOS it is streamed into
+        `scripts/stream_extract.py` without being written to disk, and its
+        files are checked against the `.sha256` manifest published with it by
+        `with_named_artifacts`, if any. Windows, where the pipe would go
+        through PowerShell, and zstd archives, which Python cannot read,
+        are downloaded first and extracted with `tar`.
+        """
+        if extract and rename:
+            raise ValueError("Extracted artifacts cannot be renamed")
         queue_service = self.get_proxy_url() + "/api/queue"
-        ret = self.with_dependencies(task_id).with_curl_script(
-            queue_service
-            + "/v1/task/%s/artifacts/%s/%s" % (task_id, directory, artifact_name),
-            os.path.join(out_directory, rename or url_basename(artifact_name)),
-            as_gha=as_gha,
-        )
+        url = queue_service + "/v1/task/%s/artifacts/%s/" % (task_id, directory)
+        self.with_dependencies(task_id)
+
+        if extract and self.platform() != "win" and not artifact_name.endswith(".zst"):
+            manifest = re.sub(r"\.(tar(\.\w+)?|tgz)$", "", artifact_name) + ".sha256"
+            # GHA script steps only run with `set -e`, which would not see
+            # curl failing on the left of the pipe
+            return self.with_script(
+                """
+                set -o pipefail
+                curl --compressed --retry 5 --connect-timeout 10 -Lf "%s" | python3 $HOME/tasks/$TASK_ID/ci/scripts/stream_extract.py "%s" --manifest "%s"
+            """
+                % (url + artifact_name, out_directory or ".", url + manifest),
+                as_gha=as_gha,
+            )
+
+        path = os.path.join(out_directory, rename or url_basename(artifact_name))
+        ret = self.with_curl_script(url + artifact_name, path, as_gha=as_gha)
         if extract:
             ret = self.with_script(
-                "tar xvf %s"
-                % os.path.join(out_directory, rename or url_basename(artifact_name)),
-                as_gha=as_gha,
+                "tar xf %s -C %s" % (path, out_directory or "."), as_gha=as_gha
             )
 
         return ret
@@ -515,12 +851,7 @@ class Task:
             )
             self.action_paths.add(action_path)
 
-        if not any(
-            CONFIG.git_ref == "refs/heads/%s" % branch for branch in DEPLOY_BRANCHES
-        ) and not CONFIG.git_ref.startswith("refs/tags/"):
-            gha = gha.with_env("PAHKAT_NO_DEPLOY", "true")
-
-        if "[no deploy]" in CONFIG.commit_message:
+        if not deploys_enabled():
             gha = gha.with_env("PAHKAT_NO_DEPLOY", "true")
 
         self.gh_actions[name] = gha
@@ -579,7 +910,17 @@ class GenericWorkerTask(Task):
         self.mounts: List[Dict[str, str]] = []
 
     with_max_run_time_minutes = chaining(setattr, "max_run_time_minutes")
-    with_mounts = chaining(append_to_attr, "mounts")
+
+    def with_mounts(self, *mounts: Dict):
+        """
+        Add `mounts` to the task, ignoring those whose file or directory is
+        already mounted so that every tool is only downloaded once.
+        """
+        for mount in mounts:
+            target = mount.get("directory") or mount.get("file")
+            if all(target != (m.get("directory") or m.get("file")) for m in self.mounts):
+                self.mounts.append(mount)
+        return self
 
     def build_command(self):  # pragma: no cover
         """
@@ -598,19 +939,10 @@ class GenericWorkerTask(Task):
             "command": self.build_command(),
             "maxRunTime": self.max_run_time_minutes * 60,
         }
-        mounts = []
-        seen = set()
-        for m in self.mounts:
-            if "directory" not in m:
-                mounts.append(m)
-            elif m["directory"] not in seen:
-                mounts.append(m)
-                seen.add(m["directory"])
-
         return dict_update_if_truthy(
             worker_payload,
             env=self.env,
-            mounts=mounts,
+            mounts=self.mounts,
             features=self.features,
             artifacts=[
                 {
@@ -662,14 +994,19 @@ class GenericWorkerTask(Task):
         )
 
     def with_directory_mount(
-        self, url_or_artifact_name: str, task_id=None, sha256=None, path=None
+        self,
+        url_or_artifact_name: str,
+        task_id=None,
+        sha256=None,
+        path=None,
+        format=None,
     ):
         """
         Make `generic-worker` download an archive before the task starts,
         and uncompress it at `path` (which is relative to the task’s home directory).
 
-        `url_or_artifact_name` must end in one of `.rar`, `.tar.bz2`, `.tar.gz`, or `.zip`.
-        The archive must be in the corresponding format.
+        `url_or_artifact_name` must end in one of `.rar`, `.tar.bz2`, `.tar.gz`, or `.zip`,
+        unless `format` is given. The archive must be in the corresponding format.
 
         If `sha256` is provided, `generic-worker` will hash the downloaded archive
         and check it against the provided signature.
@@ -678,6 +1015,18 @@ class GenericWorkerTask(Task):
         and `url_or_artifact_name` is the name of an artifact of that task.
         """
         supported_formats = ["rar", "tar.bz2", "tar.gz", "zip"]
+        if format is not None:
+            assert format in supported_formats
+            assert path is not None
+            return self.with_mounts(
+                {
+                    "directory": path,
+                    "content": self._mount_content(
+                        url_or_artifact_name, task_id, sha256
+                    ),
+                    "format": format,
+                }
+            )
         for fmt in supported_formats:
             suffix = "." + fmt
             if url_or_artifact_name.endswith(suffix):
@@ -702,8 +1051,16 @@ class WindowsGenericWorkerTask(GenericWorkerTask):
     Task definition for a `generic-worker` task running on Windows.
 
     Scripts are written as `.bat` files executed with `cmd.exe`.
+
+    Toolchains, `PATH` entries and mounts are registered once however many
+    times they are requested, and `PATH` is set by a single command.
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.toolchains: Set[str] = set()
+        self.path_entries: List[str] = []
+
     def platform(self):
         return "win"
 
@@ -738,24 +1095,21 @@ class WindowsGenericWorkerTask(GenericWorkerTask):
         )
 
     def build_command(self):
-        return [
-            'cmd.exe /C "{}"'.format(
-                deindent("\n".join(self.scripts + self.late_scripts))
-            )
-        ]
+        scripts = self.scripts + self.late_scripts
+        if self.path_entries:
+            path = "".join(f"%HOMEDRIVE%%HOMEPATH%\\{p};" for p in self.path_entries)
+            scripts = [f'set "PATH={path}%PATH%"'] + scripts
+        return ['cmd.exe /C "{}"'.format(deindent("\n".join(scripts)))]
 
     def with_path_from_homedir(self, *paths: str):
         """
         Interpret each path in `paths` as relative to the task’s home directory,
-        and add it to the `PATH` environment variable.
+        and add it to the `PATH` environment variable, before any script runs.
+        Paths added first come first in `PATH`.
         """
         for p in paths:
-            self.with_early_script(
-                'set "PATH=%HOMEDRIVE%%HOMEPATH%\\{};%PATH%"'.format(p)
-            )
-            self.with_early_script(
-                'set "PATH=%HOMEDRIVE%%HOMEPATH%\\{};%PATH%"'.format(p)
-            )
+            if p not in self.path_entries:
+                self.path_entries.append(p)
         return self
 
     def with_repo(self, path, fetch_url, fetch_ref, checkout_sha, sparse_checkout=None):
@@ -798,6 +1152,30 @@ class WindowsGenericWorkerTask(GenericWorkerTask):
         )
         return self.with_git().with_script(git)
 
+    def git_mirror_path(self, url: str) -> str:
+        return f"{CONFIG.windows_cache_root}\\git-mirrors\\{cache_name(url)}.git"
+
+    def git_mirror_script(self, url: str, path: str) -> str:
+        return f"""
+            if not exist {path} git init -q --bare {path}
+            git -C {path} config gc.auto 0
+            git -C {path} fetch -q {url} +refs/heads/*:refs/heads/* +refs/tags/*:refs/tags/* || echo Could not update the mirror of {url}
+        """
+
+    def with_borrowed_objects(self, path: str, repo_url: str):
+        mirror = self.git_mirror(repo_url)
+        self.with_git().with_script(
+            f"""
+            git init -q {path}
+            git -C {path} remote add origin {repo_url}
+        """
+        )
+        if mirror is not None:
+            self.with_script(
+                f"echo {mirror}\\objects> {path}\\.git\\objects\\info\\alternates"
+            )
+        return self
+
     def with_repo_bundle(self, name: str, dest: str, **kwargs):
         return self.with_curl_artifact_script(
             CONFIG.decision_task_id,
@@ -812,81 +1190,138 @@ class WindowsGenericWorkerTask(GenericWorkerTask):
             **kwargs,
         )
 
+    def with_toolchain(self, name: str):
+        """
+        Mount the toolchain `name` of `toolchains.TOOLCHAINS` and add it to `PATH`.
+        Toolchains marked `repack` are mounted from `toolchain_repack_task`, and
+        the ones without a pinned `sha256` from `toolchain_mirror_task`.
+        """
+        if name in self.toolchains:
+            return self
+        self.toolchains.add(name)
+
+        tool = toolchains.TOOLCHAINS["win"][name]
+        if not tool["sha256"] and not tool.get("repack"):
+            task_id = toolchain_mirror_task("win", name)
+            self.with_dependencies(task_id)
+            artifact = f"public/{name}.{tool['format']}"
+            if tool["format"] == "file":
+                self.with_file_mount(artifact, task_id=task_id, path=tool["path"])
+            else:
+                self.with_directory_mount(
+                    artifact, task_id=task_id, path=tool["path"], format=tool["format"]
+                )
+        elif tool.get("repack"):
+            task_id = toolchain_repack_task("win", name)
+            self.with_dependencies(task_id).with_directory_mount(
+                f"public/{name}.tar.gz",
+                task_id=task_id,
+                path=tool["path"],
+                format="tar.gz",
+            )
+        elif tool["format"] == "file":
+            self.with_file_mount(tool["url"], sha256=tool["sha256"], path=tool["path"])
+        else:
+            self.with_directory_mount(
+                tool["url"],
+                sha256=tool["sha256"],
+                path=tool["path"],
+                format=tool["format"],
+            )
+        return self.with_path_from_homedir(*tool["bin"])
+
     def with_git(self):
         """
         Make the task download `git-for-windows` and make it available for `git` commands.
 
         This is implied by `with_repo`.
         """
-        return (
-            self.with_path_from_homedir("git\\cmd")
-            .with_path_from_homedir("git\\bin")
-            .with_path_from_homedir("git\\mingw64\\bin")
-            .with_directory_mount(
-                "https://github.com/git-for-windows/git/releases/download/v2.34.1.windows.1/Git-2.34.1-64-bit.tar.bz2",
-                path="git",
-            )
-            .with_script("git config --global core.protectNTFS false")
+        if "git" in self.toolchains:
+            return self
+        return self.with_toolchain("git").with_script(
+            "git config --global core.protectNTFS false"
         )
 
     def with_cmake(self):
-        return self.with_path_from_homedir(
-            "cmake\\cmake-3.23.1-windows-x86_64\\bin"
-        ).with_directory_mount(
-            "https://github.com/Kitware/CMake/releases/download/v3.23.1/cmake-3.23.1-windows-x86_64.zip",
-            path="cmake",
-        )
+        return self.with_toolchain("cmake")
 
     def with_curl_script(self, url, file_path, as_gha=False):
         self.with_curl()
         return super().with_curl_script(url, file_path, as_gha)
 
     def with_curl(self):
-        return self.with_path_from_homedir(
-            "curl\\curl-8.3.0_1-win64-mingw\\bin"
-        ).with_directory_mount(
-            "https://curl.se/windows/dl-8.3.0_1/curl-8.3.0_1-win64-mingw.zip",
-            path="curl",
-        )
+        return self.with_toolchain("curl")
 
     def with_rustup(self):
         """
         Download rustup.rs and make it available to task commands,
         but does not download any default toolchain.
         """
-        return (
-            self.with_path_from_homedir(".cargo\\bin")
-            .with_early_script(
-                "%HOMEDRIVE%%HOMEPATH%\\rustup-init.exe --default-toolchain none --profile=minimal -y"
-            )
-            .with_file_mount("https://win.rustup.rs/x86_64", path="rustup-init.exe")
+        return self.with_toolchain("rustup").with_early_script(
+            "%HOMEDRIVE%%HOMEPATH%\\rustup-init.exe --default-toolchain none --profile=minimal -y"
         )
 
-    def with_python3(self):
+    def with_sccache(self, key: str, max_size: Optional[str] = None):
         """
-        For Python 3, use `with_directory_mount` and the "embeddable zip file" distribution
-        from python.org.
-        You may need to remove `python37._pth` from the ZIP in order to work around
-        <https://bugs.python.org/issue34841>.
+        Use sccache as the rustc wrapper, with a local disk cache in a persistent
+        directory of the worker, one per `key` (usually toolchain and target).
+        sccache evicts the least recently used entries once `max_size` is reached.
         """
         return (
-            self.with_curl_script(
-                "https://www.python.org/ftp/python/3.10.0/python-3.10.0-amd64.exe",
-                "do-the-python.exe",
+            self.with_toolchain("sccache")
+            .with_env(
+                RUSTC_WRAPPER="sccache",
+                SCCACHE_DIR=f"{CONFIG.windows_cache_root}\\sccache\\{cache_name(key)}",
+                SCCACHE_CACHE_SIZE=max_size or CONFIG.sccache_cache_size,
             )
-            .with_script(
-                "start /wait do-the-python.exe /quiet TargetDir=%HOMEDRIVE%%HOMEPATH%\\python3 InstallAllUsers=0 InstallLauncherAllUsers=0 /log C:\\log",
+            .with_gha(
+                "sccache",
+                gha.GithubActionScript(
+                    "sccache --zero-stats",
+                    post_script="sccache --show-stats; sccache --stop-server",
+                ),
             )
-            .with_path_from_homedir("python3", "python3\\Scripts")
         )
 
+    def with_python3(self):
+        """
+        Mount the NuGet distribution of Python, which unlike the installer
+        needs no setup and is cached by the worker.
+        """
+        return self.with_toolchain("python3")
+
     def gen_gha_payload(self, name: str):
         return self._gen_gha_payload("win", name)
 
 
 class UnixTaskMixin(Task):
+    def git_mirror_script(self, url: str, path: str) -> str:
+        return f"""
+            [ -d {path} ] || git init -q --bare {path}
+            git -C {path} config gc.auto 0
+            git -C {path} fetch -q {url} "+refs/heads/*:refs/heads/*" "+refs/tags/*:refs/tags/*" || echo "Could not update the mirror of {url}"
+        """
+
+    def with_borrowed_objects(self, path: str, repo_url: str):
+        mirror = self.git_mirror(repo_url)
+        self.with_script(
+            f"""
+            git init -q {path}
+            git -C {path} remote add origin {repo_url}
+        """
+        )
+        if mirror is not None:
+            self.with_script(f"echo {mirror}/objects > {path}/.git/objects/info/alternates")
+        return self
+
     def with_repo(
-        self, name, fetch_url, fetch_ref, checkout_sha, alternate_object_dir=""
+        self,
+        name,
+        fetch_url,
+        fetch_ref,
+        checkout_sha,
+        alternate_object_dir="",
+        sparse_checkout=None,
     ):
         """
         Make a clone the git repository at the start of the task.
@@ -899,14 +1334,22 @@ class UnixTaskMixin(Task):
           at the root of the Docker container’s filesystem.
           `git` and `ca-certificate` need to be installed in the Docker image.
 
+        If `sparse_checkout` is given, it must be a list of path patterns
+        to be used in `.git/info/sparse-checkout`.
         """
+        sparse = ""
+        if sparse_checkout:
+            sparse = """
+            git config core.sparsecheckout true
+            printf '%s\\n' {} > .git/info/sparse-checkout
+            """.format(" ".join(shlex.quote(p) for p in sparse_checkout))
         # Not using $GIT_ALTERNATE_OBJECT_DIRECTORIES since it causes
         # "object not found - no match for id" errors when Cargo fetches git dependencies
         return self.with_script(
             """
             git init {}
             cd {}
-            echo "{alternate}" > .git/objects/info/alternates
+            echo "{alternate}" > .git/objects/info/alternates{sparse}
             time git fetch --no-tags {} {}
             time git reset --hard {}
         """.format(
@@ -916,6 +1359,7 @@ class UnixTaskMixin(Task):
                 assert_truthy(fetch_ref),
                 assert_truthy(checkout_sha),
                 alternate=alternate_object_dir,
+                sparse=sparse,
             )
         )
 
@@ -936,6 +1380,9 @@ class MacOsGenericWorkerTask(UnixTaskMixin, GenericWorkerTask):
         """
         return "http://taskcluster:8080"
 
+    def git_mirror_path(self, url: str) -> str:
+        return f"{CONFIG.macos_cache_root}/git-mirrors/{cache_name(url)}.git"
+
     def build_command(self):
         # generic-worker accepts multiple commands, but unlike on Windows
         # the current directory and environment variables
@@ -972,6 +1419,63 @@ class MacOsGenericWorkerTask(UnixTaskMixin, GenericWorkerTask):
         """
         )
 
+    def with_sccache(self, key: str, max_size: Optional[str] = None):
+        """
+        Use sccache as the rustc wrapper, with a local disk cache in a persistent
+        directory of the worker, one per `key` (usually toolchain and target).
+        sccache evicts the least recently used entries once `max_size` is reached.
+
+        The server is restarted so that it picks up this task's cache directory.
+        """
+        bin_dir = f"{CONFIG.macos_cache_root}/bin"
+        sccache = f"{bin_dir}/sccache-{CONFIG.sccache_version}"
+        release = f"sccache-{CONFIG.sccache_version}-$(uname -m | sed s/arm64/aarch64/)-apple-darwin"
+        return self.with_script(
+            f"""
+            mkdir -p {bin_dir}
+            if [ ! -x {sccache} ]; then
+                SCCACHE_TMP=$(mktemp -d)
+                curl --retry 5 --connect-timeout 10 -Lf https://github.com/mozilla/sccache/releases/download/{CONFIG.sccache_version}/{release}.tar.gz | tar -xz -C $SCCACHE_TMP --strip-components=1
+                mv $SCCACHE_TMP/sccache {sccache}
+                rm -rf $SCCACHE_TMP
+            fi
+            export RUSTC_WRAPPER={sccache}
+            export SCCACHE_DIR={CONFIG.macos_cache_root}/sccache/{cache_name(key)}
+            export SCCACHE_CACHE_SIZE={max_size or CONFIG.sccache_cache_size}
+        """
+        ).with_gha(
+            "sccache",
+            gha.GithubActionScript(
+                "$RUSTC_WRAPPER --stop-server || true\n$RUSTC_WRAPPER --start-server",
+                post_script="$RUSTC_WRAPPER --show-stats && $RUSTC_WRAPPER --stop-server",
+            ),
+        )
+
+    def with_cargo_target_cache(self, toolchain: str, target: str):
+        """
+        Build in a persistent `CARGO_TARGET_DIR` keyed by repository, toolchain
+        and target, so that incremental artifacts survive between tasks.
+
+        Directories are handed out by `scripts/cargo_target_cache.py`, which
+        locks one for the lifetime of this task and evicts the least recently
+        used ones beyond `CONFIG.macos_cargo_target_cache_size`. If every slot
+        for the key is busy, the build falls back to the task directory.
+        Paths to build products should go through `$CARGO_TARGET_DIR`.
+        """
+        key = cache_name(f"{os.environ['REPO_NAME']}-{toolchain}-{target}")
+        return self.with_script(
+            f"""
+            CARGO_TARGET_CACHE=$(python3 $HOME/tasks/$TASK_ID/ci/scripts/cargo_target_cache.py {CONFIG.macos_cache_root}/cargo-target {key} $$ --max-size {CONFIG.macos_cargo_target_cache_size})
+            if [ -n "$CARGO_TARGET_CACHE" ]; then
+                # The CI checkout is gone by the time this runs, so release in plain bash
+                trap "rm -f $(dirname $CARGO_TARGET_CACHE)/owner; touch $(dirname $CARGO_TARGET_CACHE)/last-used" EXIT
+                export CARGO_TARGET_DIR=$CARGO_TARGET_CACHE
+            else
+                export CARGO_TARGET_DIR=$HOME/tasks/$TASK_ID/_temp/cargo-target
+            fi
+        """
+        )
+
     def gen_gha_payload(self, name: str):
         return self._gen_gha_payload("macos", name)
 
@@ -1011,6 +1515,7 @@ class DockerWorkerTask(UnixTaskMixin, Task):
         self.caches = {}
         self.features = {}
         self.capabilities = {}
+        self.apt_updated = False
 
     with_docker_image = chaining(setattr, "docker_image")
     with_max_run_time_minutes = chaining(setattr, "max_run_time_minutes")
@@ -1020,6 +1525,59 @@ class DockerWorkerTask(UnixTaskMixin, Task):
     def platform(self):
         return "linux"
 
+    def git_mirror_path(self, url: str) -> str:
+        self.with_scopes("docker-worker:cache:divvun-git-mirrors")
+        self.with_caches(**{"divvun-git-mirrors": "/root/.cache/git-mirrors"})
+        return f"/root/.cache/git-mirrors/{cache_name(url)}.git"
+
+    def with_dockerfile(self, dockerfile: str, **build_args: str):
+        """
+        Build a Docker image from `dockerfile` in a separate task and run
+        this task in it. The image task is indexed by a hash of the Dockerfile
+        and of `build_args`, so it is reused until either of them changes.
+        Anything else the image depends on must be passed as a build argument.
+        """
+        basename = os.path.basename(dockerfile)
+        suffix = ".dockerfile"
+        assert basename.endswith(suffix)
+        image_name = basename[: -len(suffix)]
+
+        with open(dockerfile, "rb") as f:
+            dockerfile_contents = f.read()
+        args = sorted(build_args.items())
+        digest = hashlib.sha256(
+            dockerfile_contents + json.dumps(args).encode()
+        ).hexdigest()
+
+        image_build_task = (
+            DockerWorkerTask("Docker image: " + image_name)
+            .with_worker_type(self.worker_type)
+            .with_provisioner_id(self.provisioner_id)
+            .with_docker_image("ubuntu:22.04")
+            .with_max_run_time_minutes(60)
+            .with_index_and_artifacts_expire_in(CONFIG.docker_images_expire_in)
+            .with_features("dind")
+            .with_env(DOCKERFILE=dockerfile_contents.decode("utf-8"))
+            .with_apt_update()
+            .with_apt_install("docker.io", "lz4")
+            .with_script(
+                """
+                echo "$DOCKERFILE" | docker build %s -t taskcluster-built -
+                docker save taskcluster-built | lz4 > /image.tar.lz4
+            """
+                % " ".join(f"--build-arg {k}={shlex.quote(v)}" for k, v in args)
+            )
+            .with_artifacts("/image.tar.lz4")
+            .find_or_create(f"docker-image.{image_name}.{digest}", per_decision=False)
+        )
+        return self.with_dependencies(image_build_task).with_docker_image(
+            {
+                "type": "task-image",
+                "path": "public/image.tar.lz4",
+                "taskId": image_build_task,
+            }
+        )
+
     def with_prep_gha_tasks(self):
         for gha in self.gh_actions.values():
             for output_from in gha.outputs_from:
@@ -1087,6 +1645,7 @@ class DockerWorkerTask(UnixTaskMixin, Task):
         return self
 
     def with_apt_update(self):
+        self.apt_updated = True
         return self.with_script(
             """
             apt update
@@ -1094,6 +1653,12 @@ class DockerWorkerTask(UnixTaskMixin, Task):
         )
 
     def with_apt_install(self, *pkgnames: str):
+        """
+        Install `pkgnames` with apt, updating the package lists first if the
+        task did not already. Images ship without them.
+        """
+        if not self.apt_updated:
+            self.with_apt_update()
         return self.with_script(
             """
             DEBIAN_FRONTEND=noninteractive apt install -y %s
@@ -1109,21 +1674,239 @@ class DockerWorkerTask(UnixTaskMixin, Task):
             % " ".join(pkgnames)
         )
 
-    def with_named_artifacts(self, name: str, path: str):
+    def with_named_artifacts(self, name: str, path: str, compression: str = "gzip"):
+        """
+        Publish the files matching `path`, a glob whose `*` also matches `/`,
+        as `name.tar.gz` (or `name.tar.zst` with `compression="zstd"`), with
+        paths relative to the directory of `path`.
+
+        The archive is written in a single pass, compressed with pigz when the
+        image has it. `name.sha256` lists the hash of every archived file and
+        can be checked with `sha256sum -c` where the archive is extracted.
+        """
         assert "/" not in name
-        targz = name + ".tar.gz"
+        if compression == "zstd":
+            archive = name + ".tar.zst"
+            compress = "zstd -T0 -q -c"
+            self.with_apt_install("zstd")
+        elif compression == "gzip":
+            archive = name + ".tar.gz"
+            compress = "$(command -v pigz || echo gzip) -c"
+        else:
+            raise ValueError("Unknown compression: " + compression)
         basedir = os.path.dirname(path)
         files = os.path.basename(path)
         return self.with_late_script(
             f"""
-            find {basedir} -wholename "{files}" -exec tar -P --xform="s#{basedir}/##" -rvf /{targz} {{}} \\;
+            find {basedir} ! -type d -path "{basedir}/{files}" -printf '%P\\0' | LC_ALL=C sort -z > /{name}.files
+            (cd {basedir} && xargs -0 -r sha256sum -- < /{name}.files) > /{name}.sha256
+            tar -C {basedir} --null -T /{name}.files -cf - | {compress} > /{archive}
+        """
+        ).with_artifacts("/" + archive, "/" + name + ".sha256")
+
+    def with_sccache(self, key: str, max_size: Optional[str] = None):
+        """
+        Use sccache as the rustc wrapper, with a local disk cache stored in a
+        docker-worker cache volume, one per `key` (usually toolchain and target).
+        sccache evicts the least recently used entries once `max_size` is reached.
+        """
+        cache_dir = "/root/.cache/sccache"
+        release = f"sccache-{CONFIG.sccache_version}-x86_64-unknown-linux-musl"
+        return (
+            self.with_caches(**{"divvun-sccache-" + cache_name(key): cache_dir})
+            .with_env(
+                RUSTC_WRAPPER="sccache",
+                SCCACHE_DIR=cache_dir,
+                SCCACHE_CACHE_SIZE=max_size or CONFIG.sccache_cache_size,
+            )
+            .with_script(
+                f"""
+            curl --retry 5 --connect-timeout 10 -Lf https://github.com/mozilla/sccache/releases/download/{CONFIG.sccache_version}/{release}.tar.gz | tar -xz -C /usr/local/bin --strip-components=1 {release}/sccache
+        """
+            )
+            .with_gha(
+                "sccache",
+                gha.GithubActionScript(
+                    "sccache --zero-stats", post_script="sccache --show-stats"
+                ),
+            )
+        )
+
+    def with_android_ndk(self, version: str):
+        """
+        Install the Android NDK `version` (such as "r27c") in a docker-worker
+        cache volume of its own, and point `ANDROID_NDK_HOME` to it. It is only
+        downloaded when the volume is new, checked against its sha256, and its
+        archive tested before being unpacked and moved into place, so that an
+        interrupted install is never mistaken for a complete one.
+
+        The version must be listed in `toolchains.py`, with its pinned sha256.
+        Until it is pinned, the NDK is downloaded from `toolchain_mirror_task`
+        and checked against the hash published there.
+        """
+        name = f"android-ndk-{version}"
+        tool = toolchains.TOOLCHAINS["linux"][name]
+        cache_dir = "/root/.cache/android-ndk"
+        ndk = f"{cache_dir}/{name}"
+        if tool["sha256"]:
+            url = tool["url"]
+            sha256 = tool["sha256"]
+        else:
+            task_id = toolchain_mirror_task("linux", name)
+            self.with_dependencies(task_id)
+            url = f"{self.get_proxy_url()}/api/queue/v1/task/{task_id}/artifacts/public/{name}.zip"
+            sha256 = f"$(curl --retry 5 --connect-timeout 10 -Lf {url}.sha256)"
+        return (
+            self.with_caches(**{"divvun-android-ndk-" + cache_name(version): cache_dir})
+            .with_apt_install("unzip")
+            .with_env(ANDROID_NDK_HOME=ndk)
+            .with_script(
+                f"""
+            if [ ! -d {ndk} ]; then
+                rm -rf {cache_dir}/tmp.*
+                NDK_TMP=$(mktemp -d {cache_dir}/tmp.XXXXXX)
+                curl --retry 5 --connect-timeout 10 -Lf -o $NDK_TMP/ndk.zip {url}
+                echo "{sha256}  $NDK_TMP/ndk.zip" | sha256sum -c -
+                unzip -tq $NDK_TMP/ndk.zip
+                unzip -q $NDK_TMP/ndk.zip -d $NDK_TMP
+                mv $NDK_TMP/{name} {ndk}
+                rm -rf $NDK_TMP
+            fi
+        """
+            )
+        )
+
+    def with_nodejs(self, version: Optional[str] = None):
+        """
+        Install Node.js `version` from nodejs.org, checked against the hashes
+        published with it, in a docker-worker cache volume of its own, and put
+        it first in `PATH`.
+        """
+        version = version or CONFIG.nodejs_version
+        cache_dir = "/root/.cache/nodejs"
+        name = f"node-v{version}-linux-x64"
+        node = f"{cache_dir}/{name}"
+        dist = f"https://nodejs.org/dist/v{version}"
+        return self.with_caches(
+            **{"divvun-nodejs-" + cache_name(version): cache_dir}
+        ).with_script(
+            f"""
+            if [ ! -d {node} ]; then
+                rm -rf {cache_dir}/tmp.*
+                NODE_TMP=$(mktemp -d {cache_dir}/tmp.XXXXXX)
+                curl --retry 5 --connect-timeout 10 -Lf -o $NODE_TMP/{name}.tar.gz {dist}/{name}.tar.gz
+                curl --retry 5 --connect-timeout 10 -Lf -o $NODE_TMP/SHASUMS256.txt {dist}/SHASUMS256.txt
+                (cd $NODE_TMP && grep " {name}.tar.gz$" SHASUMS256.txt | sha256sum -c -)
+                tar -xzf $NODE_TMP/{name}.tar.gz -C $NODE_TMP
+                mv $NODE_TMP/{name} {node}
+                rm -rf $NODE_TMP
+            fi
+            ln -sf {node}/bin/* /usr/local/bin/
+        """
+        )
+
+    def with_cargo_ndk(self, version: Optional[str] = None):
+        """
+        Add a `cargo-ndk` step, building it only once per version into a
+        docker-worker cache volume. It needs cargo, so it has to come after
+        the step installing Rust.
         """
-        ).with_artifacts("/" + targz)
+        version = version or CONFIG.cargo_ndk_version
+        root = "/root/.cache/cargo-ndk"
+        return self.with_caches(
+            **{"divvun-cargo-ndk-" + cache_name(version): root}
+        ).with_gha(
+            "install_cargo_ndk",
+            gha.GithubActionScript(
+                f"""
+                if [ ! -x {root}/bin/cargo-ndk ]; then
+                    cargo install --locked --version {version} --root {root} cargo-ndk
+                fi
+                ln -sf {root}/bin/cargo-ndk /usr/local/bin/cargo-ndk
+            """
+            ),
+        )
 
     def gen_gha_payload(self, name: str):
         return self._gen_gha_payload("linux", name)
 
 
+def toolchain_repack_task(platform: str, name: str) -> str:
+    """
+    Recompress the archive of the toolchain `name` to `{name}.tar.gz`, which
+    is much faster to extract than bzip2, and publish its sha256 next to it.
+    The task is indexed by the upstream URL and hash, so this only runs again
+    when the manifest changes. Without a pinned hash, the first download is
+    kept, as in `toolchain_mirror_task`.
+    """
+    tool = toolchains.TOOLCHAINS[platform][name]
+    upstream = f"/upstream.{tool['format']}"
+    key = hashlib.sha256(f"{tool['url']} {tool['sha256']}".encode()).hexdigest()
+    return (
+        DockerWorkerTask(f"Repack toolchain: {name}")
+        .with_worker_type("linux")
+        .with_provisioner_id(CONFIG.default_provisioner_id)
+        .with_docker_image("ubuntu:22.04")
+        .with_index_and_artifacts_expire_in("1 year")
+        .with_apt_update()
+        .with_apt_install("curl", "ca-certificates", "bzip2")
+        .with_script(
+            f"""
+            curl --retry 5 --connect-timeout 10 -Lf "{tool['url']}" -o {upstream}
+            {toolchain_check(tool, upstream)}
+            mkdir /toolchain
+            tar -xaf {upstream} -C /toolchain
+            tar -czf /{name}.tar.gz -C /toolchain .
+            sha256sum /{name}.tar.gz | cut -d" " -f1 > /{name}.tar.gz.sha256
+        """
+        )
+        .with_artifacts(f"/{name}.tar.gz", f"/{name}.tar.gz.sha256")
+        .find_or_create(f"toolchain.{platform}.{name}.{key}", per_decision=False)
+    )
+
+
+def toolchain_check(tool: dict, path: str) -> str:
+    """
+    Script checking the download of `tool` at `path` against its pinned
+    sha256, or printing the hash to pin if it has none.
+    """
+    if tool["sha256"]:
+        return f'echo "{tool["sha256"]}  {path}" | sha256sum -c'
+    return f'echo "No sha256 pinned for {tool["url"]}, downloaded $(sha256sum {path})"'
+
+
+def toolchain_mirror_task(platform: str, name: str) -> str:
+    """
+    Publish the download of the toolchain `name`, which has no pinned
+    sha256, unchanged as `{name}.{format}` with its sha256 next to it.
+
+    The task is indexed by the upstream URL for a year, so every task mounts
+    the bytes of that first download, rather than whatever the URL serves
+    at the time. The hash it prints is the one to pin in `toolchains.py`.
+    """
+    tool = toolchains.TOOLCHAINS[platform][name]
+    artifact = f"/{name}.{tool['format']}"
+    key = hashlib.sha256(tool["url"].encode()).hexdigest()
+    return (
+        DockerWorkerTask(f"Mirror toolchain: {name}")
+        .with_worker_type("linux")
+        .with_provisioner_id(CONFIG.default_provisioner_id)
+        .with_docker_image("ubuntu:22.04")
+        .with_index_and_artifacts_expire_in("1 year")
+        .with_apt_update()
+        .with_apt_install("curl", "ca-certificates")
+        .with_script(
+            f"""
+            curl --retry 5 --connect-timeout 10 -Lf "{tool['url']}" -o {artifact}
+            {toolchain_check(tool, artifact)}
+            sha256sum {artifact} | cut -d" " -f1 > {artifact}.sha256
+        """
+        )
+        .with_artifacts(artifact, f"{artifact}.sha256")
+        .find_or_create(f"toolchain-mirror.{platform}.{name}.{key}", per_decision=False)
+    )
+
+
 def assert_truthy(x):
     assert x
     return x
@@ -1144,6 +1927,20 @@ def url_basename(url: str) -> str:
     return url.rpartition("/")[-1]
 
 
+def cache_name(key: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", key)
+
+
+def latest_index_path(index_path: str) -> str:
+    """
+    Index path of the last successful run of a path filtered task.
+
+    Repositories share index paths like `lang.build`, so it includes the
+    repository name to not compare against another repository's run.
+    """
+    return f"latest.{cache_name(os.environ['REPO_NAME'])}.{index_path}"
+
+
 @contextlib.contextmanager
 def make_repo_bundle(path: str, bundle_name: str, sha: str, *, shallow=True):
     cwd = os.getcwd()
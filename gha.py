@@ -19,11 +19,14 @@ class GithubAction:
             self.version = "master"
 
         self.args = {}
+        # Inputs declared by the action's action.yml
+        self.inputs = set()
         self.branch = branch
 
-        # FIXME: temporary hack to attempt fixing the checkout action
+        # FIXME: temporary hack to attempt fixing the checkout action.
+        # `with_checkout` needs the `filter` input, added in v4.1.0.
         if path and path == "actions/checkout":
-            self.branch = "releases/v4.0.0"
+            self.branch = self.version = "v4.2.2"
             
         self.post_path = None
         self.run_path = "index.js"
@@ -76,6 +79,7 @@ class GithubAction:
         )
         config = requests.get(url).text
         config = yaml.full_load(config)
+        self.inputs = set(config.get("inputs", {}))
         for name, content in config.get("inputs", {}).items():
             if "default" in content:
                 self.args[name] = content["default"]
@@ -176,6 +180,10 @@ class GithubAction:
         self.shell = shell
         return self
 
+    def with_run_if(self, condition):
+        self.condition = condition
+        return self
+
 
 class GithubActionScript(GithubAction):
     def __init__(self, script, *, run_if=None, post_script=None):
@@ -0,0 +1,113 @@
+"""
+Download URL into a persistent cache directory of the worker and print the
+path of the cached file.
+
+    python3 cached_download.py URL CACHE_DIR [--keep N]
+
+A cached file is reused as long as the server reports the same ETag for URL.
+Only the N most recently used downloads are kept, along with any used in the
+last IN_USE_SECONDS, which concurrent tasks of the worker may still be using.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+IN_USE_SECONDS = 2 * 3600
+
+
+@contextlib.contextmanager
+def locked(cache_dir):
+    with open(os.path.join(cache_dir, ".lock"), "w") as fd:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+
+
+def etag(url):
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request) as response:
+        return response.headers.get("ETag")
+
+
+def download(url, path):
+    with urllib.request.urlopen(url) as response, open(path, "wb") as f:
+        shutil.copyfileobj(response, f, 1 << 20)
+
+
+def evict(cache_dir, keep):
+    """
+    Remove the least recently used downloads beyond `keep`, except the ones
+    used in the last `IN_USE_SECONDS`. Must be called with `cache_dir` locked.
+    """
+    entries = [
+        os.path.join(cache_dir, name)
+        for name in os.listdir(cache_dir)
+        if not name.startswith(".") and not name.endswith((".etag", ".tmp"))
+    ]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    in_use_since = time.time() - IN_USE_SECONDS
+    for path in entries[keep:]:
+        if os.path.getmtime(path) > in_use_since:
+            continue
+        print("Evicting %s" % path, file=sys.stderr)
+        os.remove(path)
+        etag_path = os.path.splitext(path)[0] + ".etag"
+        if os.path.exists(etag_path):
+            os.remove(etag_path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url")
+    parser.add_argument("cache_dir")
+    parser.add_argument("--keep", type=int, default=4)
+    args = parser.parse_args()
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    key = hashlib.sha256(args.url.encode()).hexdigest()[:16]
+    # Keep the extension, some tools such as `installer` rely on it
+    extension = os.path.splitext(urllib.parse.urlparse(args.url).path)[1]
+    path = os.path.join(args.cache_dir, key + extension)
+    etag_path = os.path.join(args.cache_dir, key + ".etag")
+
+    current = etag(args.url)
+    with locked(args.cache_dir):
+        cached = None
+        if os.path.exists(path) and os.path.exists(etag_path):
+            with open(etag_path) as f:
+                cached = f.read()
+        reuse = current is not None and cached == current
+        if reuse:
+            # Marks it as in use, so concurrent runs don't evict it
+            os.utime(path)
+
+    if reuse:
+        print("Reusing %s for %s" % (path, args.url), file=sys.stderr)
+    else:
+        print("Downloading %s to %s" % (args.url, path), file=sys.stderr)
+        # Downloaded without the lock, so that other runs aren't held up
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            download(args.url, tmp)
+            with locked(args.cache_dir):
+                os.replace(tmp, path)
+                with open(etag_path, "w") as f:
+                    f.write(current or "")
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    with locked(args.cache_dir):
+        evict(args.cache_dir, args.keep)
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Hand out persistent cargo target directories on the macOS workers, which unlike
+the other workers keep their disk between tasks.
+
+    python3 cargo_target_cache.py ROOT KEY PID [--max-size GB] [--slots N]
+
+Directories live in ROOT, one per KEY. Before handing one out, the least
+recently used directories are removed until ROOT fits in its size budget. The
+directory is then locked on behalf of process PID (the task's shell) and the
+path to use as `CARGO_TARGET_DIR` is printed. Concurrent tasks with the same
+KEY get different slots, and a slot whose owner died is free again. Nothing is
+printed when every slot is taken.
+
+Releasing a slot only means removing its `owner` file and touching its
+`last-used` file, which the task does from a shell trap.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import os
+import shutil
+import sys
+import uuid
+
+
+@contextlib.contextmanager
+def locked(root):
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "w") as fd:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Owned by another user, but alive
+        pass
+    return True
+
+
+def is_free(slot):
+    try:
+        with open(os.path.join(slot, "owner")) as fd:
+            pid = int(fd.read().strip())
+    except (OSError, ValueError):
+        return True
+    return not is_alive(pid)
+
+
+def last_used(slot):
+    try:
+        return os.path.getmtime(os.path.join(slot, "last-used"))
+    except OSError:
+        return 0
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def evict(root, max_size, keep):
+    """
+    Move the least recently used free slots out of the way until `root` fits
+    in `max_size` bytes, and return the directories to delete. The slots of
+    the key `keep` are left alone. Must be called with `root` locked.
+    """
+    trash = []
+    slots = []
+    for name in os.listdir(root):
+        if name.startswith(".trash-"):
+            # Left over by an interrupted run
+            trash.append(os.path.join(root, name))
+        elif not name.startswith("."):
+            slots.append(os.path.join(root, name))
+
+    sizes = {slot: dir_size(slot) for slot in slots}
+    total = sum(sizes.values())
+    for slot in sorted(slots, key=last_used):
+        if total <= max_size:
+            break
+        name = os.path.basename(slot)
+        if name == keep or name.startswith(keep + ".") or not is_free(slot):
+            continue
+        dest = os.path.join(root, ".trash-" + uuid.uuid4().hex)
+        os.rename(slot, dest)
+        trash.append(dest)
+        total -= sizes[slot]
+        print("Evicting %s" % slot, file=sys.stderr)
+    return trash
+
+
+def acquire(root, key, pid, max_size, slots):
+    slot = None
+    with locked(root):
+        trash = evict(root, max_size, keep=key)
+        for i in range(slots):
+            candidate = os.path.join(root, key if i == 0 else "%s.%d" % (key, i))
+            if is_free(candidate):
+                slot = candidate
+                break
+
+        if slot is not None:
+            os.makedirs(os.path.join(slot, "target"), exist_ok=True)
+            with open(os.path.join(slot, "owner"), "w") as fd:
+                fd.write(str(pid))
+            with open(os.path.join(slot, "last-used"), "w"):
+                pass
+
+    # Deleting can take a while, don't hold the lock for it
+    for path in trash:
+        shutil.rmtree(path, ignore_errors=True)
+
+    if slot is not None:
+        return os.path.join(slot, "target")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root")
+    parser.add_argument("key")
+    parser.add_argument("pid", type=int)
+    parser.add_argument("--max-size", type=int, default=50, help="in GB")
+    parser.add_argument("--slots", type=int, default=2)
+    args = parser.parse_args()
+
+    target_dir = acquire(
+        args.root, args.key, args.pid, args.max_size * 1024**3, args.slots
+    )
+    if target_dir is not None:
+        print(target_dir)
+
+
+if __name__ == "__main__":
+    main()
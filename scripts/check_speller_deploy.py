@@ -0,0 +1,47 @@
+"""
+Compare the hash of the spellers about to be bundled with the ones of the last
+successful deploy, indexed at NAMESPACE, and tell the following steps whether
+they need to run.
+
+    python3 check_speller_deploy.py NAMESPACE ZHFST_HASH
+
+Sets the `changed` output to "true" or "false", and the `zhfst-hash` output
+to ZHFST_HASH so that the next run can compare against it. The bundle task
+is only indexed at NAMESPACE when it deploys.
+"""
+
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+
+def deployed_hash(namespace):
+    url = "%s/api/index/v1/task/%s/artifacts/private/outputs.json" % (
+        os.environ["TASKCLUSTER_PROXY_URL"],
+        namespace,
+    )
+    try:
+        with urllib.request.urlopen(url) as response:
+            outputs = json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        if e.code != 404:
+            raise
+        return None
+    return outputs.get("check_deployed", {}).get("zhfst-hash")
+
+
+namespace, zhfst_hash = sys.argv[1:]
+if zhfst_hash == "undefined":
+    # The speller task did not report a hash
+    zhfst_hash = ""
+previous = deployed_hash(namespace)
+changed = not zhfst_hash or previous != zhfst_hash
+if changed:
+    print("Spellers changed since the last deploy (%s -> %s)" % (previous, zhfst_hash))
+else:
+    print("Spellers are identical to the last deploy, skipping")
+
+print("::set-output name=zhfst-hash::%s" % zhfst_hash)
+print("::set-output name=changed::%s" % str(changed).lower())
@@ -1,59 +1,287 @@
-import toml
-import os.path
-import boto3.session
-from botocore.config import Config
+"""
+Delete the artifacts of the pahkat bucket that are no longer referenced by any
+package of the index checked out in the current directory.
+
+    python3 clean_pahkat_repos.py [--dry-run] [--index DIR] [--state FILE]
+
+With --state, the artifacts referenced by the index are kept in FILE, sorted,
+along with the index commit they were read from. The next run only parses the
+index files changed since that commit.
+
+The bucket is configured through the S3_REGION, S3_ENDPOINT, S3_ACCESS_KEY and
+S3_SECRET_KEY environment variables.
+"""
+
+import argparse
+import itertools
 import os
+import subprocess
+import sys
 import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import toml
+
+BUCKET = "divvun"
+PREFIX = "pahkat/artifacts/"
+EXCEPTIONS = {"/artifacts/giellakbd-android-jnilibs.zip"}
+
+# Maximum number of keys accepted by a single DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+
+STATE_HEADER = "# pahkat-index "
+
+
+def make_client():
+    import boto3.session
+    from botocore.config import Config
+
+    session = boto3.session.Session()
+    return session.client(
+        "s3",
+        region_name=os.environ["S3_REGION"],
+        endpoint_url=os.environ["S3_ENDPOINT"],
+        aws_access_key_id=os.environ["S3_ACCESS_KEY"],
+        aws_secret_access_key=os.environ["S3_SECRET_KEY"],
+        config=Config(retries={"max_attempts": 10, "mode": "adaptive"}),
+    )
+
+
+def index_files(root):
+    for dirpath, dirnames, files in os.walk(root):
+        # Ignore .git
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for f in files:
+            if f.endswith(".toml"):
+                yield os.path.relpath(os.path.join(dirpath, f), root)
+
+
+def is_index_file(path):
+    return path.endswith(".toml") and not any(
+        part.startswith(".") for part in path.split("/")
+    )
+
+
+def package_paths(path):
+    """Return the artifact paths referenced by the index file at `path`"""
+    parsed = toml.load(path)
+    paths = set()
+    # Packages without any release have no "release" key
+    for release in parsed.get("release", []):
+        for target in release.get("target", []):
+            url = target["payload"]["url"]
+            paths.add(urllib.parse.urlparse(url).path)
+    return paths
+
+
+def parse_index_files(root, files, workers=None):
+    """Return `(artifact path, index file)` rows for the given index files"""
+    rows = []
+    if not files:
+        return rows
+    full_paths = [os.path.join(root, f) for f in files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for f, paths in zip(
+            files, executor.map(package_paths, full_paths, chunksize=64)
+        ):
+            rows.extend((path, f) for path in paths)
+    return rows
+
+
+def git(root, *args):
+    return subprocess.run(
+        ["git", "-C", root, *args], check=True, capture_output=True, text=True
+    ).stdout
+
+
+def changed_index_files(root, old_sha, new_sha):
+    """
+    Return the index files changed between two commits, or None if `old_sha`
+    cannot be found. Only both trees are needed, so a shallow clone works
+    once the old commit has been fetched on its own.
+    """
+    try:
+        git(root, "cat-file", "-e", old_sha + "^{commit}")
+    except subprocess.CalledProcessError:
+        try:
+            git(root, "fetch", "--quiet", "--depth=1", "origin", old_sha)
+        except subprocess.CalledProcessError:
+            return None
+    # Renames are listed as a deletion and an addition so both are updated
+    output = git(root, "diff", "--name-only", "--no-renames", "-z", old_sha, new_sha)
+    return [f for f in output.split("\0") if f and is_index_file(f)]
+
+
+def load_state(state):
+    """Read the `(sha, rows)` saved by `save_state`, or `(None, [])`"""
+    try:
+        with open(state) as f:
+            header = f.readline()
+            if not header.startswith(STATE_HEADER):
+                return None, []
+            rows = [tuple(line.rstrip("\n").split("\t", 1)) for line in f]
+    except FileNotFoundError:
+        return None, []
+    return header[len(STATE_HEADER) :].strip(), rows
+
 
-session = boto3.session.Session()
-config = Config(
-   retries = {
-      'max_attempts': 10000,
-      'mode': 'legacy'
-   }
-)
-
-REGION = os.environ["S3_REGION"]
-ENDPOINT = os.environ["S3_ENDPOINT"]
-ACCESS_KEY = os.environ["S3_ACCESS_KEY"]
-SECRET_KEY = os.environ["S3_SECRET_KEY"]
-
-client = session.client('s3',
-                        region_name=REGION,
-                        endpoint_url=ENDPOINT,
-                        aws_access_key_id=ACCESS_KEY,
-                        config=config,
-                        aws_secret_access_key=SECRET_KEY)
-
-packages_in_index = set()
-exceptions = { "/artifacts/giellakbd-android-jnilibs.zip" }
-
-for root, _, files in os.walk('.'):
-    # Ignore .git
-    if root.startswith('./.'):
-        continue
-    for f in files:
-        if f.endswith('.toml'):
-            parsed = toml.load(os.path.join(root, f))
-            # Ignore packages without any release
-            if 'release' not in parsed:
+def save_state(state, sha, rows):
+    tmp = state + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("%s%s\n" % (STATE_HEADER, sha))
+        for path, index_file in rows:
+            f.write("%s\t%s\n" % (path, index_file))
+    os.replace(tmp, state)
+
+
+def referenced_packages(root, state=None, workers=None):
+    """
+    Return the sorted `(artifact path, index file)` rows of the index at
+    `root`, and how many index files had to be parsed.
+
+    With `state`, the rows of the previous run are loaded from that file and
+    only the index files changed since its commit are parsed again. The file
+    is then updated for the current commit.
+    """
+    sha = git(root, "rev-parse", "HEAD").strip() if state else None
+    old_sha, rows = load_state(state) if state else (None, [])
+
+    changed = None
+    if old_sha == sha and sha:
+        changed = []
+    elif old_sha:
+        changed = changed_index_files(root, old_sha, sha)
+
+    if changed is None:
+        print("Parsing the whole index")
+        changed = list(index_files(root))
+        rows = []
+    else:
+        print("Parsing %d index files changed since %s" % (len(changed), old_sha))
+        stale = set(changed)
+        rows = [row for row in rows if row[1] not in stale]
+
+    existing = [f for f in changed if os.path.isfile(os.path.join(root, f))]
+    rows.extend(parse_index_files(root, existing, workers))
+    rows.sort()
+
+    if state and sha:
+        save_state(state, sha, rows)
+    return rows, len(existing)
+
+
+def bucket_packages(client):
+    """Yield `(path, size)` for every artifact of the bucket, page by page"""
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET, Prefix=PREFIX):
+        for obj in page.get("Contents", []):
+            # Ignore directory objects
+            if obj["Size"] == 0:
                 continue
+            yield "/" + obj["Key"].split("/", 1)[1], obj["Size"]
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def delete_batch(client, keys):
+    """Delete `keys`, returning the list of `(key, error)` that failed"""
+    response = client.delete_objects(
+        Bucket=BUCKET,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+    )
+    return [(e["Key"], e.get("Message", e.get("Code"))) for e in response.get("Errors", [])]
+
+
+def delete_packages(client, packages, threads=8):
+    keys = sorted("pahkat/" + package[1:] for package in packages)
+    errors = []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for failed in executor.map(
+            lambda batch: delete_batch(client, batch),
+            batches(keys, DELETE_BATCH_SIZE),
+        ):
+            errors.extend(failed)
+    return errors
+
+
+def mark_referenced(in_bucket, referenced):
+    """
+    Yield `(path, size, is_referenced)` for every artifact of `in_bucket`.
+
+    Both must be sorted by path: S3 lists keys in ascending order, and
+    `referenced_packages` sorts its rows, so they are merged as they stream
+    instead of being loaded into sets.
+    """
+    referenced = iter(referenced)
+    current = next(referenced, None)
+    previous = None
+    for path, size in in_bucket:
+        if previous is not None and path < previous:
+            raise RuntimeError("Bucket listing is not sorted at %s" % path)
+        previous = path
+        while current is not None and current < path:
+            current = next(referenced, None)
+        yield path, size, path == current or path in EXCEPTIONS
+
+
+def reconcile(client, index_root, dry_run=False, state=None, workers=None, threads=8):
+    rows, parsed = referenced_packages(index_root, state, workers)
+    referenced = sum(1 for _ in itertools.groupby(path for path, _ in rows))
+
+    in_bucket = 0
+    to_remove = {}
+    for path, size, is_referenced in mark_referenced(
+        bucket_packages(client), (path for path, _ in rows)
+    ):
+        in_bucket += 1
+        if not is_referenced:
+            to_remove[path] = size
+
+    for package in to_remove:
+        print("pahkat/" + package[1:])
+
+    errors = [] if dry_run else delete_packages(client, to_remove, threads)
+    for key, error in errors:
+        print("Failed to delete %s: %s" % (key, error), file=sys.stderr)
+
+    print(
+        "%d index files parsed, %d referenced artifacts, %d artifacts in the bucket"
+        % (parsed, referenced, in_bucket)
+    )
+    print(
+        "%s %d orphans (%.1f MB), %d failed"
+        % (
+            "Would delete" if dry_run else "Deleted",
+            len(to_remove) - len(errors),
+            sum(to_remove.values()) / 1e6,
+            len(errors),
+        )
+    )
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="only list the orphans")
+    parser.add_argument("--index", default=".", help="index checkout (default: .)")
+    parser.add_argument("--state", help="file keeping the referenced artifacts")
+    parser.add_argument("--workers", type=int, help="processes parsing the index")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent deletions")
+    args = parser.parse_args()
+
+    errors = reconcile(
+        make_client(),
+        args.index,
+        dry_run=args.dry_run,
+        state=args.state,
+        workers=args.workers,
+        threads=args.threads,
+    )
+    sys.exit(1 if errors else 0)
+
 
-            for release in parsed['release']:
-                for target in release['target']:
-                    url = target['payload']['url']
-                    filename = urllib.parse.urlparse(url).path
-                    packages_in_index.add(filename)
-
-packages_in_bucket = set()
-for object_path in client.list_objects_v2(Bucket="divvun", Prefix="pahkat/artifacts/")['Contents']:
-    # Ignore directory objects
-    if object_path['Size'] == 0:
-        continue
-    packages_in_bucket.add("/" + object_path["Key"].split('/', 1)[1])
-
-packages_to_remove = packages_in_bucket - packages_in_index - exceptions
-for package in packages_to_remove:
-    path = "pahkat/" + package[1:]
-    print(path)
-    client.delete_object(Bucket='divvun', Key=path)
+if __name__ == "__main__":
+    main()
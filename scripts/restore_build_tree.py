@@ -0,0 +1,67 @@
+"""
+Extract a build tree published by a previous task, shifting its timestamps so
+that it stays newer than the sources of the fresh checkout it is restored into.
+
+    python3 restore_build_tree.py ARCHIVE DEST
+
+The relative order of the timestamps is kept, so make still sees which
+products are out of date with respect to each other.
+"""
+
+import os
+import sys
+import tarfile
+import time
+
+
+def check_member(member, dest):
+    """
+    Refuse what the "data" extraction filter would, for Pythons without
+    extraction filters (before 3.12 and the 3.8-3.11 backports).
+    """
+    root = os.path.realpath(dest)
+
+    def inside(name):
+        path = os.path.realpath(os.path.join(root, name))
+        return os.path.commonpath([path, root]) == root
+
+    if not inside(member.name):
+        raise ValueError("Refusing to extract %s outside of %s" % (member.name, dest))
+    if member.issym():
+        target = os.path.join(os.path.dirname(member.name), member.linkname)
+    elif member.islnk():
+        target = member.linkname
+    elif member.isfile() or member.isdir():
+        return
+    else:
+        raise ValueError("Refusing to extract special file %s" % member.name)
+    if os.path.isabs(member.linkname) or not inside(target):
+        raise ValueError("Refusing to extract link %s out of %s" % (member.name, dest))
+
+
+def main():
+    archive, dest = sys.argv[1:]
+
+    with tarfile.open(archive) as tar:
+        members = tar.getmembers()
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(dest, filter="data")
+        else:
+            for member in members:
+                check_member(member, dest)
+            tar.extractall(dest)
+
+    newest = max((m.mtime for m in members), default=0)
+    offset = max(0, time.time() - newest)
+    print("Shifting %d restored files by %ds" % (len(members), offset))
+
+    # Directories last, as touching their content changes their mtime
+    for member in sorted(members, key=lambda m: m.isdir()):
+        if member.issym():
+            continue
+        mtime = member.mtime + offset
+        os.utime(os.path.join(dest, member.name), (mtime, mtime))
+
+
+if __name__ == "__main__":
+    main()
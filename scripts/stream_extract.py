@@ -0,0 +1,106 @@
+"""
+Extract a tar archive read from stdin into DEST as it is downloaded, checking
+each file against the manifest published next to the archive.
+
+    curl -Lf URL | python3 stream_extract.py DEST [--manifest MANIFEST_URL]
+
+The manifest is the `sha256sum` output written by `with_named_artifacts`. If
+it cannot be found, files are extracted without being checked.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tarfile
+import urllib.error
+import urllib.request
+
+
+def load_manifest(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            lines = response.read().decode().splitlines()
+    except urllib.error.HTTPError as e:
+        if e.code != 404:
+            raise
+        print("No manifest at %s, not checking files" % url)
+        return None
+    manifest = {}
+    for line in lines:
+        digest, name = line.split(None, 1)
+        # sha256sum marks binary mode with a leading "*"
+        manifest[os.path.normpath(name.lstrip("*"))] = digest
+    return manifest
+
+
+def safe_path(dest, name):
+    path = os.path.realpath(os.path.join(dest, name))
+    if os.path.commonpath([path, os.path.realpath(dest)]) != os.path.realpath(dest):
+        raise ValueError("Refusing to extract %s outside of %s" % (name, dest))
+    return path
+
+
+def extract_other(tar, member, dest):
+    """Extract a directory or link `member`, refusing links out of `dest`"""
+    if hasattr(tarfile, "data_filter"):
+        tar.extract(member, dest, filter="data")
+        return
+    # Pythons before 3.12 (and the 3.8-3.11 backports) have no filters
+    if member.issym():
+        safe_path(dest, os.path.join(os.path.dirname(member.name), member.linkname))
+    elif member.islnk():
+        safe_path(dest, member.linkname)
+    elif not member.isdir():
+        raise ValueError("Refusing to extract special file %s" % member.name)
+    tar.extract(member, dest)
+
+
+def extract_file(tar, member, path):
+    """Write `member` to `path` and return the sha256 of its content"""
+    sha256 = hashlib.sha256()
+    source = tar.extractfile(member)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        for chunk in iter(lambda: source.read(1 << 20), b""):
+            sha256.update(chunk)
+            f.write(chunk)
+    # Like the "data" extraction filter, drop setuid and group/other write bits
+    os.chmod(path, member.mode & 0o755)
+    os.utime(path, (member.mtime, member.mtime))
+    return sha256.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dest")
+    parser.add_argument("--manifest", help="URL of the sha256 manifest")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest) if args.manifest else None
+    unchecked = set(manifest or ())
+    count = 0
+
+    # "r|*" reads the compressed stream sequentially, without seeking
+    with tarfile.open(fileobj=sys.stdin.buffer, mode="r|*") as tar:
+        for member in tar:
+            path = safe_path(args.dest, member.name)
+            count += 1
+            if not member.isfile():
+                extract_other(tar, member, args.dest)
+                continue
+            digest = extract_file(tar, member, path)
+            if manifest is None:
+                continue
+            name = os.path.normpath(member.name)
+            if manifest.get(name) != digest:
+                sys.exit("%s does not match the manifest" % member.name)
+            unchecked.discard(name)
+
+    if unchecked:
+        sys.exit("Missing from the archive: %s" % ", ".join(sorted(unchecked)))
+    print("Extracted %d entries to %s" % (count, args.dest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Download every toolchain of `toolchains.py` and print its sha256, to update
+the manifest after changing a URL. With --write, the hashes that changed are
+also written to `toolchains.py`.
+
+    python3 scripts/update_toolchain_hashes.py [--write] [NAME...]
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+from toolchains import TOOLCHAINS  # noqa: E402
+
+
+def download_sha256(url):
+    sha256 = hashlib.sha256()
+    with urllib.request.urlopen(url) as response:
+        for chunk in iter(lambda: response.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def write_sha256(source, name, digest):
+    """Replace the `sha256` of the entry `name` in the source of the manifest"""
+    entry = re.compile(r'^( *)"%s": \{$' % re.escape(name), re.MULTILINE)
+    match = entry.search(source)
+    sha256 = re.compile(r'"sha256": [^,\n]*,')
+    old = sha256.search(source, match.end())
+    return source[: old.start()] + '"sha256": "%s",' % digest + source[old.end() :]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--write", action="store_true", help="update toolchains.py")
+    parser.add_argument("names", nargs="*", metavar="NAME")
+    args = parser.parse_args()
+
+    path = os.path.join(ROOT, "toolchains.py")
+    with open(path) as f:
+        source = f.read()
+
+    for platform, tools in TOOLCHAINS.items():
+        for name, tool in tools.items():
+            if args.names and name not in args.names:
+                continue
+            digest = download_sha256(tool["url"])
+            status = "ok" if digest == tool["sha256"] else "changed"
+            print("%s %s: %s (%s)" % (platform, name, digest, status))
+            if status == "changed":
+                source = write_sha256(source, name, digest)
+
+    if args.write:
+        with open(path, "w") as f:
+            f.write(source)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from typing import List, Optional, Dict, Any, Callable
 from gha import GithubAction, GithubActionScript
 from typing import List
 from decisionlib import CONFIG
+import hashlib
 import os
 
 
@@ -17,14 +18,64 @@ RUST_ENV = {
     "RUST_BACKTRACE": "full",
     "LZMA_API_STATIC": "1",
 }
+VS_DEV_CMD = r'call "C:\Program Files (x86)\Microsoft Visual Studio\2017\BuildTools\Common7\Tools\VsDevCmd.bat"'
+# What `linux_build_task` installs on top of its image
+LINUX_BUILD_PACKAGES = [
+    "curl",
+    "git",
+    "python3",
+    "python3-pip",
+    "lsb-release",
+    "wget",
+    "pkg-config",
+    "libssl-dev",
+]
+LINUX_BUILD_PIP_PACKAGES = ["taskcluster", "pyYAML", "awscli==1.31.6"]
+# Targets built by the "windows_3264" builds, with the suffix of their binary
+WINDOWS_3264_TARGETS = [
+    ("i686-pc-windows-msvc", ""),
+    ("x86_64-pc-windows-msvc", "-x64"),
+]
 
 
-def linux_build_task(name, bundle_dest="repo", with_secrets=True, clone_self=True):
+def linux_build_task(
+    name,
+    bundle_dest="repo",
+    with_secrets=True,
+    clone_self=True,
+    checkout="blobless",
+    sparse: Optional[List[str]] = None,
+    dockerfile: Optional[str] = None,
+    dockerfile_args: Dict[str, str] = {},
+):
+    """
+    `checkout` is the mode of the checkout of the repository under test, and
+    `sparse` the only paths of it the task needs, see `with_checkout`.
+
+    With `dockerfile`, the task runs in the image it builds instead of a bare
+    Ubuntu. The image must install the `PACKAGES` and `PIP_PACKAGES` build
+    arguments and Node.js `NODE_VERSION`, which the task then skips.
+    """
     task = (
         decisionlib.DockerWorkerTask(name)
         .with_worker_type("linux")
         .with_provisioner_id("divvun")
         .with_docker_image("ubuntu:22.04")
+    )
+    if dockerfile is not None:
+        task.with_dockerfile(
+            dockerfile,
+            PACKAGES=" ".join(LINUX_BUILD_PACKAGES),
+            PIP_PACKAGES=" ".join(LINUX_BUILD_PIP_PACKAGES),
+            NODE_VERSION=CONFIG.nodejs_version,
+            **dockerfile_args,
+        )
+    else:
+        task.with_apt_update().with_apt_install(*LINUX_BUILD_PACKAGES).with_pip_install(
+            *LINUX_BUILD_PIP_PACKAGES
+        ).with_nodejs()
+    task = (
+        task
         # https://docs.taskcluster.net/docs/reference/workers/docker-worker/docs/caches
         .with_scopes("docker-worker:cache:divvun-*")
         .with_scopes("queue:get-artifact:private/*")
@@ -43,31 +94,22 @@ def linux_build_task(name, bundle_dest="repo", with_secrets=True, clone_self=Tru
         .with_max_run_time_minutes(60)
         .with_script("mkdir -p $HOME/tasks/$TASK_ID")
         .with_script("mkdir -p $HOME/tasks/$TASK_ID/_temp")
-        .with_apt_update()
-        .with_apt_install("curl", "git", "python3", "python3-pip", "lsb-release")
-        .with_pip_install("taskcluster", "pyYAML", "awscli==1.31.6")
-        .with_apt_install("wget", "nodejs")
-        .with_apt_install("pkg-config", "libssl-dev")
         .with_additional_repo(
             os.environ["CI_REPO_URL"],
             "${HOME}/tasks/${TASK_ID}/ci",
             branch=os.environ["CI_REPO_REF"],
         )
-        .with_gha(
-            "clone",
-            GithubAction(
-                "actions/checkout",
-                {
-                    "repository": os.environ["REPO_FULL_NAME"],
-                    "path": bundle_dest,
-                    "ref": CONFIG.git_sha,
-                    "fetch-depth": 0,
-                },
-                enable_post=False,
-            ).with_secret_input("token", "divvun", "github.token"),
-            enabled=clone_self and not CONFIG.index_read_only,
-        )
-        .with_additional_repo(
+    )
+    with_checkout(
+        task,
+        bundle_dest,
+        checkout,
+        ref=CONFIG.git_sha,
+        sparse=sparse,
+        enabled=clone_self and not CONFIG.index_read_only,
+    )
+    return (
+        task.with_additional_repo(
             os.environ["GIT_URL"],
             f"${{HOME}}/tasks/${{TASK_ID}}/{bundle_dest}",
             enabled=CONFIG.index_read_only,
@@ -78,11 +120,14 @@ def linux_build_task(name, bundle_dest="repo", with_secrets=True, clone_self=Tru
             enabled=clone_self,
         )
     )
-    return task
 
 
-def macos_task(name):
-    return (
+def macos_task(name, checkout="blobless", sparse: Optional[List[str]] = None):
+    """
+    `checkout` is the mode of the checkout of the repository under test, and
+    `sparse` the only paths of it the task needs, see `with_checkout`.
+    """
+    task = (
         decisionlib.MacOsGenericWorkerTask(name)
         .with_worker_type("macos")
         .with_scopes("queue:get-artifact:private/*")
@@ -100,20 +145,12 @@ def macos_task(name):
             "${HOME}/tasks/${TASK_ID}/ci",
             branch=os.environ["CI_REPO_REF"],
         )
-        .with_gha(
-            "clone",
-            GithubAction(
-                "actions/checkout",
-                {
-                    "repository": os.environ["REPO_FULL_NAME"],
-                    "path": "repo",
-                    "fetch-depth": 0,
-                },
-                enable_post=False,
-            ).with_secret_input("token", "divvun", "github.token"),
-            enabled=not CONFIG.index_read_only,
-        )
-        .with_additional_repo(
+    )
+    with_checkout(
+        task, "repo", checkout, sparse=sparse, enabled=not CONFIG.index_read_only
+    )
+    return (
+        task.with_additional_repo(
             os.environ["GIT_URL"],
             "${HOME}/tasks/${TASK_ID}/repo",
             enabled=CONFIG.index_read_only,
@@ -124,8 +161,14 @@ def macos_task(name):
     )
 
 
-def windows_task(name, clone_self=True):
-    return (
+def windows_task(
+    name, clone_self=True, checkout="blobless", sparse: Optional[List[str]] = None
+):
+    """
+    `checkout` is the mode of the checkout of the repository under test, and
+    `sparse` the only paths of it the task needs, see `with_checkout`.
+    """
+    task = (
         decisionlib.WindowsGenericWorkerTask(name)
         .with_worker_type("windows")
         .with_provisioner_id("divvun")
@@ -144,26 +187,18 @@ def windows_task(name, clone_self=True):
             "%HOMEDRIVE%%HOMEPATH%\\%TASK_ID%\\ci",
             branch=os.environ["CI_REPO_REF"],
         )
-        .with_gha(
-            "clone",
-            GithubAction(
-                "actions/checkout",
-                {
-                    "repository": os.environ["REPO_FULL_NAME"],
-                    "path": "repo",
-                    "fetch-depth": 0,
-                },
-                enable_post=False,
-            ).with_secret_input("token", "divvun", "github.token"),
-            enabled=not CONFIG.index_read_only,
-        )
-        .with_additional_repo(
+    )
+    with_checkout(
+        task, "repo", checkout, sparse=sparse, enabled=not CONFIG.index_read_only
+    )
+    return (
+        task.with_additional_repo(
             os.environ["GIT_URL"],
             "%HOMEDRIVE%%HOMEPATH%\\%TASK_ID%\\repo",
             enabled=CONFIG.index_read_only,
         )
         .with_python3()
-        .with_script("pip install --user taskcluster")
+        .with_script("python -m pip install --user taskcluster")
         .with_gha(
             "Set CWD",
             GithubActionScript(
@@ -179,6 +214,86 @@ def windows_task(name, clone_self=True):
     )
 
 
+def gha_checkout(
+    path: str,
+    mode: str = "blobless",
+    ref: Optional[str] = None,
+    sparse: Optional[List[str]] = None,
+):
+    """
+    `actions/checkout` of the repository under test into `path`, relative to
+    the task directory. See `with_checkout` for `mode` and `sparse`.
+    """
+    args: Dict[str, Any] = {
+        "repository": os.environ["REPO_FULL_NAME"],
+        "path": path,
+        # The task directory is new, and cleaning would delete the repository
+        # `with_checkout` prepares to borrow objects from the worker's mirror
+        "clean": "false",
+    }
+    if ref is not None:
+        args["ref"] = ref
+    if mode == "blobless":
+        args.update({"fetch-depth": 0, "filter": "blob:none"})
+    elif mode == "full":
+        args["fetch-depth"] = 0
+    elif mode == "shallow":
+        args.update({"fetch-depth": 1, "fetch-tags": "true"})
+    else:
+        raise ValueError("Unknown checkout mode: " + mode)
+    if sparse:
+        args.update(
+            {
+                "filter": "blob:none",
+                "sparse-checkout": "\n".join(sparse),
+                "sparse-checkout-cone-mode": "false",
+            }
+        )
+    return GithubAction("actions/checkout", args, enable_post=False).with_secret_input(
+        "token", "divvun", "github.token"
+    )
+
+
+def with_checkout(
+    task: decisionlib.Task,
+    dest: str,
+    mode: str = "blobless",
+    ref: Optional[str] = None,
+    sparse: Optional[List[str]] = None,
+    enabled=True,
+):
+    """
+    Check out the repository under test into `dest`, relative to the task
+    directory. `mode` is one of:
+
+    - "blobless": every commit and tree, but only the files of the checked
+      out commit. Older ones are downloaded if something asks for them.
+    - "full": the whole history with every file.
+    - "shallow": only the checked out commit, plus the tags that the
+      `version` action reads.
+    - "bundle": the checked out tree, without history or tags, from a
+      bundle made once by the decision task. It saves a GitHub clone per
+      task, but the commit has a different hash than `CONFIG.git_sha`.
+
+    If `sparse` is given, only the files matching its patterns, in the
+    non-cone `.git/info/sparse-checkout` syntax, are checked out. With a
+    GitHub clone the others are not even downloaded, whatever the mode.
+    """
+    if not enabled:
+        return task
+    if mode == "bundle":
+        return task.with_repo_bundle(
+            CONFIG.repo_bundle(), dest, sparse_checkout=sparse
+        )
+    # Borrow the objects of the worker's mirror, if any
+    if task.platform() == "win":
+        path = "%HOMEDRIVE%%HOMEPATH%\\%TASK_ID%\\" + dest
+    else:
+        path = "${HOME}/tasks/${TASK_ID}/" + dest
+    task.with_borrowed_objects(path, f"https://github.com/{os.environ['REPO_FULL_NAME']}")
+    return task.with_gha("clone", gha_checkout(dest, mode, ref, sparse))
+
+
 def gha_setup():
     return GithubAction("divvun/taskcluster-gha/setup", {}).with_secret_input(
         "key", "divvun", "DIVVUN_KEY"
@@ -196,7 +311,94 @@ def gha_pahkat(packages: List[str]):
     )
 
 
-def rust_task_for_os(os_):
+def cargo_vendor_task(cargo_lock_path: str) -> Optional[str]:
+    """
+    Vendor the crates locked in `cargo_lock_path` once, on Linux, and publish
+    them as `cargo-vendor.tar.gz`. The task is indexed by the hash of the
+    lockfile so every OS, and every later decision task, can reuse it.
+
+    Returns `None` if the repository has no such lockfile.
+    """
+    lockfile = CONFIG.repo_file(cargo_lock_path)
+    if lockfile is None:
+        return None
+
+    workspace = os.path.dirname(cargo_lock_path) or "."
+    return (
+        linux_build_task("Vendor cargo dependencies")
+        .with_gha(
+            "install_rust",
+            GithubAction(
+                "actions-rs/toolchain",
+                {"toolchain": "stable", "profile": "minimal", "override": "true"},
+            ),
+        )
+        .with_gha(
+            "vendor",
+            GithubActionScript(
+                f"""
+                cd {workspace}
+                cargo vendor --locked --versioned-dirs vendor > cargo-vendor.toml
+                tar -czf /cargo-vendor.tar.gz vendor cargo-vendor.toml
+            """
+            ),
+        )
+        .with_artifacts("/cargo-vendor.tar.gz")
+        .find_or_create(
+            f"cargo-vendor.{hashlib.sha256(lockfile).hexdigest()}",
+            per_decision=False,
+        )
+    )
+
+
+def gha_cargo_vendor(os_, cargo_lock_path: str):
+    """
+    Use the crates vendored by `cargo_vendor_task` instead of the registry.
+
+    The source replacement goes to the cargo config of the task directory,
+    above the checkout, which cargo merges with the repository's own config.
+    Appending it to the latter would repeat any `[source]` table it already
+    has, which cargo rejects. `[source]` cannot be set through `CARGO_*`
+    variables, and `--config` would have to be passed to every cargo command.
+    """
+    workspace = os.path.dirname(cargo_lock_path) or "."
+    if os_ in ["windows", "windows_3264"]:
+        return GithubActionScript(
+            f"""
+            cd {workspace}
+            tar -xzf cargo-vendor.tar.gz
+            $dir = "$env:HOMEDRIVE$env:HOMEPATH\\$env:TASK_ID\\.cargo"
+            New-Item -ItemType Directory -Force $dir | Out-Null
+            (Get-Content cargo-vendor.toml) -replace '^directory = "vendor"$', "directory = '$((Get-Location).Path)\\vendor'" | Add-Content "$dir\\config.toml"
+        """
+        )
+    return GithubActionScript(
+        f"""
+        cd {workspace}
+        tar -xzf cargo-vendor.tar.gz
+        mkdir -p $HOME/tasks/$TASK_ID/.cargo
+        sed 's|^directory = "vendor"$|directory = "'"$PWD"'/vendor"|' cargo-vendor.toml >> $HOME/tasks/$TASK_ID/.cargo/config.toml
+    """
+    )
+
+
+def with_compile_cache(task, toolchain, target, enabled=True):
+    """
+    Wrap rustc with sccache for `task`, with a cache shared by every task
+    building for the same toolchain and target on that kind of worker.
+    """
+    if not enabled:
+        return task
+    return task.with_sccache(f"{toolchain}-{target}")
+
+
+def rust_task_for_os(os_, compile_cache=True, target_cache=False):
+    """
+    Return a function creating a task with a stable Rust toolchain for `os_`.
+
+    With `target_cache`, macOS tasks build in a persistent `$CARGO_TARGET_DIR`
+    (see `MacOsGenericWorkerTask.with_cargo_target_cache`) instead of `target`.
+    """
     if os_ in ["windows", "windows_3264"]:
         install_rust = GithubAction(
             "actions-rs/toolchain",
@@ -218,12 +420,18 @@ def rust_task_for_os(os_):
                 "target": "x86_64-pc-windows-msvc",
             },
         )
-        return lambda name: (
+        targets = ["i686-pc-windows-msvc"]
+        if os_ == "windows_3264":
+            targets.append("x86_64-pc-windows-msvc")
+        return lambda name: with_compile_cache(
             windows_task(name)
             .with_cmake()
             .with_rustup()
             .with_gha("install_rust", install_rust)
-            .with_gha("install_rust64", install_rust64, enabled=(os_ == "windows_3264"))
+            .with_gha("install_rust64", install_rust64, enabled=(os_ == "windows_3264")),
+            "stable",
+            "+".join(targets),
+            enabled=compile_cache,
         )
     elif os_ == "macos":
         install_rust = GithubAction(
@@ -235,8 +443,20 @@ def rust_task_for_os(os_):
                 "components": "rustfmt,clippy",
             },
         )
-        return lambda name: macos_task(name).with_gha("install_rust", install_rust)
+        def macos_rust_task(name):
+            task = with_compile_cache(
+                macos_task(name).with_gha("install_rust", install_rust),
+                "stable",
+                "apple-darwin",
+                enabled=compile_cache,
+            )
+            if target_cache:
+                task.with_cargo_target_cache("stable", "apple-darwin")
+            return task
+
+        return macos_rust_task
     elif os_ == "linux":
+        target = "x86_64-unknown-linux-musl"
         install_rust = GithubAction(
             "actions-rs/toolchain",
             {
@@ -244,20 +464,102 @@ def rust_task_for_os(os_):
                 "profile": "minimal",
                 "override": "true",
                 "components": "rustfmt,clippy",
-                "target": "x86_64-unknown-linux-musl",
+                "target": target,
             },
         )
-        return (
-            lambda name: linux_build_task(name)
+        return lambda name: with_compile_cache(
+            linux_build_task(name)
             .with_gha(
                 "setup_linux", GithubActionScript("apt install -y musl musl-tools")
             )
-            .with_gha("install_rust", install_rust)
+            .with_gha("install_rust", install_rust),
+            "stable",
+            target,
+            enabled=compile_cache,
         )
     else:
         raise NotImplementedError
 
 
+def with_cargo_vendor(task, os_, vendor_lockfile, vendor_task_id):
+    if vendor_task_id is None:
+        return task
+    return (
+        task.with_curl_artifact_script(
+            vendor_task_id,
+            "cargo-vendor.tar.gz",
+            os.path.dirname(vendor_lockfile),
+            as_gha=True,
+        )
+        .with_gha("vendor", gha_cargo_vendor(os_, vendor_lockfile))
+        .with_env(CARGO_NET_OFFLINE="true")
+    )
+
+
+def _windows_target_build_task(
+    task_name,
+    target,
+    artifact_name,
+    cargo_toml_path,
+    package_id,
+    target_dir,
+    bin_name,
+    env,
+    features,
+    depends_on,
+    compile_cache,
+    vendor_lockfile,
+    vendor_task_id,
+    path_filters,
+):
+    """
+    Build `bin_name` for a single Windows `target` and publish it as `artifact_name`.
+    """
+    install_rust = GithubAction(
+        "actions-rs/toolchain",
+        {
+            "toolchain": "stable",
+            "profile": "minimal",
+            "override": "true",
+            "target": target,
+        },
+    )
+    task = with_compile_cache(
+        windows_task(f"{task_name}: {target}")
+        .with_cmake()
+        .with_rustup()
+        .with_gha("install_rust", install_rust),
+        "stable",
+        target,
+        enabled=compile_cache,
+    )
+    return (
+        with_cargo_vendor(task, "windows", vendor_lockfile, vendor_task_id)
+        .with_env(**env)
+        .with_path_filter(*path_filters)
+        .with_script(VS_DEV_CMD)
+        .with_gha(
+            "build",
+            GithubAction(
+                "actions-rs/cargo",
+                {
+                    "command": "build",
+                    "args": f"--release {features} --manifest-path {cargo_toml_path} --target {target} --verbose",
+                },
+            ),
+        )
+        .with_gha(
+            "artifact",
+            GithubActionScript(
+                f"mv {target_dir}/{target}/release/{bin_name}.exe ../../{artifact_name}"
+            ),
+        )
+        .with_artifacts(artifact_name)
+        .with_dependencies(*depends_on)
+        .find_or_create(f"build.{package_id}__{bin_name}.{target}.{CONFIG.index_path}")
+    )
+
+
 def _generic_rust_build_upload_task(
     os_,
     task_name,
@@ -272,6 +574,11 @@ def _generic_rust_build_upload_task(
     version_action,
     repository,
     depends_on,
+    compile_cache,
+    vendor_lockfile,
+    vendor_task_id,
+    split_targets,
+    path_filters,
 ):
     if os_ in ["windows", "windows_3264"]:
         target_dir = "\\".join(target_dir.split("/"))
@@ -366,7 +673,7 @@ def _generic_rust_build_upload_task(
             (
                 "dist",
                 GithubActionScript(
-                    f"mkdir -p dist/bin && mv {target_dir}/release/{bin_name} dist/bin/{rename_binary}"
+                    f"mkdir -p dist/bin && cp ${{CARGO_TARGET_DIR:-{target_dir}}}/release/{bin_name} dist/bin/{rename_binary}"
                 ),
             )
         ]
@@ -409,7 +716,7 @@ def _generic_rust_build_upload_task(
             (
                 "dist",
                 GithubActionScript(
-                    f"mkdir -p dist/bin && mv {target_dir}/release/{bin_name} dist/bin/{rename_binary}"
+                    f"mkdir -p dist/bin && cp ${{CARGO_TARGET_DIR:-{target_dir}}}/release/{bin_name} dist/bin/{rename_binary}"
                 ),
             )
         ]
@@ -430,12 +737,50 @@ def _generic_rust_build_upload_task(
     else:
         raise NotImplementedError
 
+    if os_ == "windows_3264" and split_targets:
+        # Compile each target in its own task and only sign, bundle and
+        # deploy the resulting binaries here. The downloads don't create
+        # missing directories, so `dist\bin` is created first.
+        task = windows_task(f"{task_name}: {os_}").with_gha(
+            "dist", GithubActionScript("mkdir dist\\bin")
+        )
+        dist = []
+        for target, suffix in WINDOWS_3264_TARGETS:
+            build_task_id = _windows_target_build_task(
+                task_name,
+                target,
+                f"{rename_binary}{suffix}.exe",
+                cargo_toml_path,
+                package_id,
+                target_dir,
+                bin_name,
+                env,
+                features,
+                depends_on,
+                compile_cache,
+                vendor_lockfile,
+                vendor_task_id,
+                path_filters,
+            )
+            task.with_curl_artifact_script(
+                build_task_id, f"{rename_binary}{suffix}.exe", "dist/bin", as_gha=True
+            )
+        build = []
+    else:
+        task = with_cargo_vendor(
+            rust_task_for_os(os_, compile_cache, target_cache=compile_cache)(
+                f"{task_name}: {os_}"
+            ),
+            os_,
+            vendor_lockfile,
+            vendor_task_id,
+        ).with_env(**env)
+
     return (
-        rust_task_for_os(os_)(f"{task_name}: {os_}")
-        .with_env(**env)
+        task.with_path_filter(*path_filters)
         .with_script(
-            r'call "C:\Program Files (x86)\Microsoft Visual Studio\2017\BuildTools\Common7\Tools\VsDevCmd.bat"'
-            if os_ in ["windows", "windows_3264"]
+            VS_DEV_CMD
+            if os_ in ["windows", "windows_3264"] and not split_targets
             else ""
         )
         .with_gha("setup", gha_setup())
@@ -475,7 +820,26 @@ def generic_rust_build_upload_task(
     *,
     repository: str = "devtools",
     depends_on: List[str] = [],
+    compile_cache: bool = True,
+    vendor_lockfile: Optional[str] = None,
+    split_targets: bool = False,
+    path_filters: List[str] = [],
 ):
+    """
+    Build, sign and deploy `bin_name` on each OS of `only_os`.
+
+    If `vendor_lockfile` is given, the dependencies it locks are downloaded
+    once by `cargo_vendor_task` and every OS builds offline from them.
+
+    With `compile_cache`, builds go through sccache, and on macOS also reuse
+    a persistent cargo target directory.
+
+    If `split_targets` is set, "windows_3264" compiles each target in a
+    parallel task and a lighter task signs, bundles and deploys both binaries.
+
+    With `path_filters`, see `Task.with_path_filter`, the tasks are reused
+    from the last build of the branch unless a matching file changed.
+    """
     if rename_binary is None:
         rename_binary = bin_name
     if version_action is None:
@@ -485,6 +849,9 @@ def generic_rust_build_upload_task(
         ).with_secret_input("GITHUB_TOKEN", "divvun", "GITHUB_TOKEN")
     if only_os is None:
         only_os = ["macos", "windows", "linux"]
+    vendor_task_id = None
+    if vendor_lockfile is not None:
+        vendor_task_id = cargo_vendor_task(vendor_lockfile)
 
     for os_ in only_os:
         if get_features is not None:
@@ -505,14 +872,19 @@ def generic_rust_build_upload_task(
             version_action,
             repository,
             depends_on,
+            compile_cache,
+            vendor_lockfile,
+            vendor_task_id,
+            split_targets,
+            path_filters,
         )
 
 
-def generic_rust_task(index_name, name, setup_fn):
+def generic_rust_task(index_name, name, setup_fn, compile_cache=True):
     oses = ["macos", "windows", "linux"]
     tasks = []
     for os_ in oses:
-        task = rust_task_for_os(os_)("%s: %s" % (name, os_))
+        task = rust_task_for_os(os_, compile_cache)("%s: %s" % (name, os_))
         setup_fn(task)
         task_id = task.find_or_create(f"build.{index_name}.{os_}.{CONFIG.index_path}")
         tasks.append(task_id)
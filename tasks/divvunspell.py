@@ -12,6 +12,8 @@ def create_divvunspell_tasks():
 def create_macos_build():
     return (
         macos_task("MacOS divvunspell build")
+        .with_sccache("stable-apple-darwin")
+        .with_cargo_target_cache("stable", "apple-darwin")
         .with_gha("setup", gha_setup())
         .with_gha("install_deps", gha_pahkat(["pahkat-uploader"]))
         .with_gha(
@@ -50,13 +52,13 @@ def create_macos_build():
                 {"command": "build", "args": "--release --target aarch64-apple-darwin --lib --features compression,internal_ffi"},
             ),
         )
-        .with_gha("codesign aarch64", GithubAction("divvun/taskcluster-gha/codesign", {"path": "target/aarch64-apple-darwin/release/libdivvunspell.dylib" }))
-        .with_gha("codesign x86_64", GithubAction("divvun/taskcluster-gha/codesign", {"path": "target/release/libdivvunspell.dylib" }))
+        .with_gha("codesign aarch64", GithubAction("divvun/taskcluster-gha/codesign", {"path": "$CARGO_TARGET_DIR/aarch64-apple-darwin/release/libdivvunspell.dylib" }))
+        .with_gha("codesign x86_64", GithubAction("divvun/taskcluster-gha/codesign", {"path": "$CARGO_TARGET_DIR/release/libdivvunspell.dylib" }))
         .with_gha("prepare_lib", GithubActionScript("""
             mkdir -p lib/lib/aarch64
             mkdir -p lib/lib/x86_64
-            mv target/aarch64-apple-darwin/release/*.dylib lib/lib/aarch64
-            mv target/release/*.dylib lib/lib/x86_64
+            cp $CARGO_TARGET_DIR/aarch64-apple-darwin/release/*.dylib lib/lib/aarch64
+            cp $CARGO_TARGET_DIR/release/*.dylib lib/lib/x86_64
         """))
         .with_gha(
             "bundle_lib",
@@ -85,7 +87,8 @@ def create_macos_build():
 def create_android_build():
     return (
         linux_build_task("Android divvunspell build")
-            .with_apt_install("unzip")
+            .with_android_ndk("r27c")
+            .with_sccache("stable-android")
             .with_gha("setup", gha_setup())
             .with_gha("install_deps", gha_pahkat(["pahkat-uploader"]))
             .with_gha(
@@ -99,11 +102,6 @@ def create_android_build():
                     },
                 ).with_secret_input("GITHUB_TOKEN", "divvun", "GITHUB_TOKEN"),
             )
-            .with_gha("download_ndk", GithubActionScript("""
-                cd $GITHUB_WORKSPACE
-                curl -o android-ndk.zip https://dl.google.com/android/repository/android-ndk-r27c-linux.zip
-                unzip android-ndk.zip
-            """))
             .with_gha(
                 "install_rust",
                 GithubAction(
@@ -118,13 +116,11 @@ def create_android_build():
             .with_gha("add_targets", GithubActionScript("""
                 rustup target add aarch64-linux-android armv7-linux-androideabi x86_64-linux-android i686-linux-android
             """))
-            .with_gha("install_cargo_ndk", GithubActionScript("""
-                cargo install cargo-ndk
-            """))
+            .with_cargo_ndk()
             .with_gha("build", GithubAction("actions-rs/cargo", {
                 "command": "ndk",
                 "args": "-t armeabi-v7a -t arm64-v8a -o ./lib build -vv --lib --release --features internal_ffi",
-            }).with_env("ANDROID_NDK_HOME", "$GITHUB_WORKSPACE/android-ndk-r27c"))
+            }))
             .with_gha("prepare_lib", GithubActionScript("""
                 mkdir -p lib/lib
                 mv lib/arm* lib/lib
@@ -1,14 +1,13 @@
 from decisionlib import CONFIG
-from gha import GithubAction, GithubActionScript
-from ..common import (
-    linux_build_task,
-    gha_setup,
-    gha_pahkat,
-    PAHKAT_REPO,
-    NIGHTLY_CHANNEL,
-    generic_rust_build_upload_task,
-    RUST_ENV,
-)
+from gha import GithubActionScript
+from ..common import linux_build_task
+
+# The repomgr release used to nuke nightlies, as deployed to the devtools
+# repository by the pahkat builds. Bump it to use a newer one.
+REPOMGR_VERSION = "2.3.0"
+REPOMGR_URL = f"https://divvun.ams3.cdn.digitaloceanspaces.com/pahkat/artifacts/pahkat-repomgr_{REPOMGR_VERSION}_linux_x86_64.txz"
+
+PAHKAT_REPOS = ["main", "tools", "divvun-installer", "devtools"]
 
 
 def create_mirror_cleanup_task():
@@ -20,48 +19,35 @@ def create_mirror_cleanup_task():
         )
         .with_script("mkdir ~/.ssh && chmod 700 ~/.ssh && mv tmp/id_ed25519 ~/.ssh && chmod 600 ~/.ssh/id_ed25519")
         .with_script("ssh-keyscan github.com pahkat.uit.no > ~/.ssh/known_hosts")
-        .with_additional_repo(
-            "https://github.com/divvun/pahkat", "pahkat"
+        .with_apt_install("xz-utils")
+        .with_script(
+            f"""
+            mkdir -p /root/repomgr
+            curl --retry 5 --connect-timeout 10 -Lf "{REPOMGR_URL}" | tar -xJ -C /root/repomgr
+            """
         )
         .with_additional_repo(
             "git@github.com:divvun/pahkat.uit.no-index", "index"
         )
-        .with_gha(
-            "Set CWD",
-            GithubActionScript(f"echo ::set-cwd::$HOME/pahkat"),
-        )
-        .with_gha(
-            "install_rust",
-            GithubAction(
-                "actions-rs/toolchain",
-                {
-                    "toolchain": "stable",
-                    "profile": "minimal",
-                    "override": "true",
-                },
-            ),
-        )
-        .with_gha(
-            "build",
-            GithubAction(
-                "actions-rs/cargo",
-                {
-                    "command": "build",
-                    "args": f"--release --verbose -p pahkat-repomgr",
-                },
-            ),
-        )
+        .with_caches(**{"divvun-pahkat-index": "/root/.cache/pahkat-index"})
         .with_script("ssh root@pahkat.uit.no systemctl stop pahkat-reposrv", as_gha=True)
         .with_gha("nuke_nightlies", GithubActionScript(
-            """
+            f"""
             cd /root/index
             git config user.email "feedback@divvun.no"
             git config user.name "divvunbot"
             git pull origin main
-            /root/pahkat/target/release/repomgr nuke package nightlies -k 5 -r ./main
-            /root/pahkat/target/release/repomgr nuke package nightlies -k 5 -r ./tools
-            /root/pahkat/target/release/repomgr nuke package nightlies -k 5 -r ./divvun-installer
-            /root/pahkat/target/release/repomgr nuke package nightlies -k 5 -r ./devtools
+            # Each repo is its own directory, so they can be nuked concurrently
+            pids=""
+            for repo in {" ".join(PAHKAT_REPOS)}; do
+                /root/repomgr/bin/repomgr nuke package nightlies -k 5 -r ./$repo &
+                pids="$pids $!"
+            done
+            status=0
+            for pid in $pids; do
+                wait $pid || status=1
+            done
+            [ $status -eq 0 ] || exit $status
             git commit -a -m "[CI] Cleanup old nightlies" || exit 0
             git push origin main
             """, post_script="sleep 2 && ssh root@pahkat.uit.no systemctl restart pahkat-reposrv"
@@ -71,7 +57,7 @@ def create_mirror_cleanup_task():
         .with_gha("clean_bucket", GithubActionScript("""
             pip3 install boto3 toml
             cd /root/index
-            python3 /root/tasks/${TASK_ID}/ci/scripts/clean_pahkat_repos.py
+            python3 /root/tasks/${TASK_ID}/ci/scripts/clean_pahkat_repos.py --state /root/.cache/pahkat-index/referenced.tsv
         """).with_env("S3_REGION", "ams3").with_env("S3_ENDPOINT", "https://ams3.digitaloceanspaces.com").with_env("S3_ACCESS_KEY", "${{ secrets.divvun-deploy.S3_ACCESS_KEY }}").with_env("S3_SECRET_KEY", "${{ secrets.divvun-deploy.S3_SECRET_KEY }}"))
         .find_or_create(f"cleanup.pahkat.uit.no.{CONFIG.index_path}")
     )
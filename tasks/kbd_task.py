@@ -1,43 +1,71 @@
 from gha import GithubAction
-from decisionlib import CONFIG
+import decisionlib
+from decisionlib import CONFIG, cache_name
 from .common import macos_task, windows_task, gha_setup, gha_pahkat, NIGHTLY_CHANNEL
-import subprocess
-import os
+
+
+KEYBOARD_BUILD_ACTION = "divvun/taskcluster-gha/keyboard/build"
+# The builders of each target file of a bundle
+KEYBOARD_TARGETS = {"macos.yaml": "macos-latest", "windows.yaml": "windows-latest"}
 
 
 def create_kbd_tasks():
-    print(subprocess.check_output("git init repo && cd repo && git fetch --depth 1 {} {} && git reset --hard FETCH_HEAD".format(CONFIG.git_url, CONFIG.git_ref), shell=True))
-    has_windows_target = False
-    has_macos_target = False
+    # Without `bundle-path`, the action builds every bundle of the repository,
+    # so there can only be one task per target
+    per_bundle = "bundle-path" in GithubAction(KEYBOARD_BUILD_ACTION, {}).inputs
+    builds = []
+    for target in CONFIG.repo_glob("*.kbdgen/targets/*.yaml"):
+        bundle, name = target.rsplit("/targets/", 1)
+        build = (KEYBOARD_TARGETS.get(name), bundle if per_bundle else None)
+        if build[0] is not None and build not in builds:
+            builds.append(build)
+
+    task_ids = [create_kbd_task(os_name, bundle) for os_name, bundle in builds]
+
+    if len(task_ids) > 1:
+        create_kbd_status_task(task_ids)
+
+
+def create_kbd_status_task(task_ids):
+    """
+    Succeed once every keyboard build did, to report on the whole repository.
+    """
+    return (
+        decisionlib.DockerWorkerTask("Keyboards")
+        .with_worker_type("linux")
+        .with_provisioner_id("divvun")
+        .with_docker_image("ubuntu:22.04")
+        .with_max_run_time_minutes(5)
+        .with_dependencies(*task_ids)
+        .with_script(f"echo 'Built {len(task_ids)} keyboards'")
+        .find_or_create(f"kbdgen.all.{CONFIG.index_path}")
+    )
 
-    for f in os.listdir('repo'):
-        if f.endswith('.kbdgen'):
-            bundle_path = os.path.join("repo", f)
-            has_macos_target = os.path.isfile(os.path.join(bundle_path, "targets", "macos.yaml"))
-            has_windows_target = os.path.isfile(os.path.join(bundle_path, "targets", "windows.yaml"))
 
-    if has_macos_target:
-        create_kbd_task("macos-latest")
-    if has_windows_target:
-        create_kbd_task("windows-latest")
+def gha_keyboard_build(keyboard_type, bundle):
+    args = {"keyboard-type": keyboard_type, "nightly-channel": NIGHTLY_CHANNEL}
+    if bundle is not None:
+        args["bundle-path"] = bundle
+    return GithubAction(KEYBOARD_BUILD_ACTION, args)
 
-def create_kbd_task(os_name):
+
+def create_kbd_task(os_name, bundle=None):
+    """
+    Build and deploy `bundle` for `os_name`, or every bundle of the repository
+    if it is None.
+    """
+    index_key = f"{os_name}_x64"
+    name = f"Build keyboard: {os_name}"
+    if bundle is not None:
+        index_key += "." + cache_name(bundle[: -len(".kbdgen")])
+        name = f"Build keyboard: {bundle} {os_name}"
     if os_name == "windows-latest":
         return (
-            windows_task(f"Build keyboard: {os_name}")
+            windows_task(name)
             .with_git()
             .with_gha("setup", gha_setup())
             .with_gha("init", gha_pahkat(["pahkat-uploader", "kbdgen"]))
-            .with_gha(
-                "build",
-                GithubAction(
-                    "divvun/taskcluster-gha/keyboard/build",
-                    {
-                        "keyboard-type": "keyboard-windows",
-                        "nightly-channel": NIGHTLY_CHANNEL,
-                    },
-                ),
-            )
+            .with_gha("build", gha_keyboard_build("keyboard-windows", bundle))
             .with_gha(
                 "upload",
                 GithubAction(
@@ -49,12 +77,12 @@ def create_kbd_task(os_name):
                     },
                 ),
             )
-            .find_or_create(f"kbdgen.{os_name}_x64.{CONFIG.index_path}")
+            .find_or_create(f"kbdgen.{index_key}.{CONFIG.index_path}")
         )
 
     if os_name == "macos-latest":
         return (
-            macos_task(f"Build keyboard: {os_name}")
+            macos_task(name)
             .with_gha("setup", gha_setup())
             .with_gha(
                 "init",
@@ -66,16 +94,7 @@ def create_kbd_task(os_name):
                     ]
                 ),
             )
-            .with_gha(
-                "build",
-                GithubAction(
-                    "divvun/taskcluster-gha/keyboard/build",
-                    {
-                        "keyboard-type": "keyboard-macos",
-                        "nightly-channel": NIGHTLY_CHANNEL,
-                    },
-                ),
-            )
+            .with_gha("build", gha_keyboard_build("keyboard-macos", bundle))
             .with_gha(
                 "upload",
                 GithubAction(
@@ -87,7 +106,7 @@ def create_kbd_task(os_name):
                     },
                 ),
             )
-            .find_or_create(f"kbdgen.{os_name}_x64.{CONFIG.index_path}")
+            .find_or_create(f"kbdgen.{index_key}.{CONFIG.index_path}")
         )
 
     raise NotImplementedError
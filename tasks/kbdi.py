@@ -26,6 +26,7 @@ def create_kbdi_deploy_task():
         bin_name="kbdi",
         env=RUST_ENV,
         setup_uploader=setup_uploader,
+        split_targets=True,
     )
 
 
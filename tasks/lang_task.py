@@ -1,5 +1,8 @@
+import hashlib
+import os
+
 from gha import GithubAction, GithubActionScript
-from decisionlib import CONFIG
+from decisionlib import CONFIG, cache_name, deploys_enabled, remote_head
 from .common import linux_build_task, macos_task, windows_task, NIGHTLY_CHANNEL, gha_setup
 
 NO_DEPLOY_LANG = {
@@ -13,6 +16,26 @@ INSTALL_APERTIUM_LANG = {
     "hil",
 }
 
+LANG_TOOLCHAIN_DOCKERFILE = os.path.join(
+    os.path.dirname(__file__), "..", "docker", "lang-toolchain.dockerfile"
+)
+
+LANG_STAGES = ["analysers", "spellers", "grammar-checkers"]
+
+# The only files of the lang repository that the bundle tasks read, the
+# spellers themselves come from the lang task's artifacts
+BUNDLE_SPARSE_CHECKOUT = ["/manifest.toml"]
+
+
+GIELLALT_SHARED_REPOS = [
+    "giella-core",
+    "giella-shared",
+    "shared-eng",
+    "shared-urj-Cyrl",
+    "shared-smi",
+    "shared-mul",
+]
+
 
 def create_lang_tasks(repo_name):
     should_install_apertium = (
@@ -20,25 +43,40 @@ def create_lang_tasks(repo_name):
         or repo_name[len("lang-"):] in INSTALL_APERTIUM_LANG
     )
 
-    should_build_analysers = CONFIG.tc_config.get(
-        'build', {}).get('analysers', False)
-    should_build_spellers = CONFIG.tc_config.get(
-        'build', {}).get('spellers', False)
-    should_build_grammar_checkers = CONFIG.tc_config.get(
-        'build', {}).get('grammar-checkers', False)
-
-    previous_task_id = None
-    speller_task_id = None
-
-    if should_build_analysers:
-        previous_task_id = create_analysers_task(should_install_apertium)
+    build_config = CONFIG.tc_config.get('build', {})
+    stages = [stage for stage in LANG_STAGES if build_config.get(stage, False)]
+    dependencies = lang_stage_dependencies(stages, build_config.get('depends'))
+    # Hand each stage's build tree to the stages depending on it, so that
+    # they only build what it did not
+    incremental = build_config.get('incremental', False)
 
-    if should_build_spellers:
-        previous_task_id = create_spellers_task(previous_task_id)
-        speller_task_id = previous_task_id
+    shared_task_id = None
+    if stages:
+        shared_task_id = create_giellalt_shared_task()
 
-    if should_build_grammar_checkers:
-        previous_task_id = create_grammar_checkers_task(previous_task_id)
+    task_ids = {}
+    for stage in topological_order(dependencies):
+        dependency_ids = [task_ids[dep] for dep in dependencies[stage]]
+        kwargs = {
+            "build_tree_from": dependency_ids[0]
+            if incremental and dependency_ids
+            else None,
+            "publish_build_tree": incremental
+            and any(stage in deps for deps in dependencies.values()),
+        }
+        if stage == "analysers":
+            task_ids[stage] = create_analysers_task(
+                shared_task_id, dependency_ids, should_install_apertium, **kwargs
+            )
+        elif stage == "spellers":
+            task_ids[stage] = create_spellers_task(
+                shared_task_id, dependency_ids, **kwargs
+            )
+        else:
+            task_ids[stage] = create_grammar_checkers_task(
+                shared_task_id, dependency_ids, **kwargs
+            )
+    speller_task_id = task_ids.get("spellers")
 
     # index_read_only means this is a PR and shouldn't run deployment steps
     if repo_name[len("lang-"):] in NO_DEPLOY_LANG or CONFIG.index_read_only:
@@ -52,7 +90,88 @@ def create_lang_tasks(repo_name):
         create_bundle_task(os_, type_, speller_task_id)
 
 
-def create_analysers_task(with_apertium):
+def lang_stage_dependencies(stages, declared):
+    """
+    Map each of `stages` to the stages it depends on. `declared` is the
+    `build.depends` mapping of `.build-config.yml`, whose stages run in
+    parallel unless they depend on each other. Without it, stages run one
+    after the other, in `LANG_STAGES` order.
+    """
+    if declared is None:
+        return {stage: stages[:i][-1:] for i, stage in enumerate(stages)}
+
+    for stage, deps in declared.items():
+        for name in [stage, *deps]:
+            if name not in LANG_STAGES:
+                raise ValueError(f"Unknown lang build stage in build.depends: {name}")
+    return {
+        stage: [dep for dep in declared.get(stage, []) if dep in stages]
+        for stage in stages
+    }
+
+
+def topological_order(dependencies):
+    order = []
+    visiting = set()
+
+    def visit(stage):
+        if stage in order:
+            return
+        if stage in visiting:
+            raise ValueError(f"Dependency cycle in build.depends at {stage}")
+        visiting.add(stage)
+        for dep in dependencies[stage]:
+            visit(dep)
+        order.append(stage)
+
+    for stage in dependencies:
+        visit(stage)
+    return order
+
+
+def create_giellalt_shared_task():
+    """
+    Snapshot the shared giellalt repositories at their current heads into
+    `giellalt-shared.tar.gz`. The task is indexed by those commits, so the
+    repositories are only fetched again once one of them changes.
+    """
+    shas = {
+        repo: remote_head(f"https://github.com/giellalt/{repo}.git")
+        for repo in GIELLALT_SHARED_REPOS
+    }
+
+    digest = hashlib.sha256(
+        "".join(f"{repo} {sha}\n" for repo, sha in shas.items()).encode()
+    ).hexdigest()
+
+    fetch = "\n".join(
+        f"""
+        git init -q {repo}
+        git -C {repo} fetch --depth=1 https://github.com/giellalt/{repo}.git {sha}
+        git -C {repo} checkout -q FETCH_HEAD
+        """
+        for repo, sha in shas.items()
+    )
+    return (
+        linux_build_task("Snapshot giellalt shared repositories", clone_self=False)
+        .with_script(
+            "mkdir -p /giellalt-shared",
+            "cd /giellalt-shared",
+            fetch,
+            f"tar -czf /giellalt-shared.tar.gz {' '.join(shas)}",
+        )
+        .with_artifacts("/giellalt-shared.tar.gz")
+        .find_or_create(f"giellalt-shared.{digest}", per_decision=False)
+    )
+
+
+def create_analysers_task(
+    shared_task_id,
+    dependency_ids,
+    with_apertium,
+    build_tree_from=None,
+    publish_build_tree=False,
+):
     should_check_analysers = CONFIG.tc_config.get(
         'check', {}).get('analysers', False)
     if should_check_analysers:
@@ -62,7 +181,14 @@ def create_analysers_task(with_apertium):
     task_suffix = "-analysers"
 
     return (
-        base_lang_task(task_name, with_apertium)
+        base_lang_task(
+            task_name,
+            shared_task_id,
+            with_apertium,
+            build_tree_from=build_tree_from,
+            publish_build_tree=publish_build_tree,
+        )
+        .with_dependencies(*dependency_ids)
         .with_gha(
             "build_analysers",
             GithubAction(
@@ -84,7 +210,9 @@ def create_analysers_task(with_apertium):
     )
 
 
-def create_spellers_task(dependent_task_id):
+def create_spellers_task(
+    shared_task_id, dependency_ids, build_tree_from=None, publish_build_tree=False
+):
     should_check_spellers = CONFIG.tc_config.get(
         'check', {}).get('spellers', False)
     if should_check_spellers:
@@ -94,8 +222,13 @@ def create_spellers_task(dependent_task_id):
     task_suiffix = "-spellers"
 
     return (
-        base_lang_task(task_name)
-        .with_dependencies(dependent_task_id)
+        base_lang_task(
+            task_name,
+            shared_task_id,
+            build_tree_from=build_tree_from,
+            publish_build_tree=publish_build_tree,
+        )
+        .with_dependencies(*dependency_ids)
         .with_gha(
             "build_spellers",
             GithubAction(
@@ -108,6 +241,16 @@ def create_spellers_task(dependent_task_id):
                 "divvun/taskcluster-gha/lang/check", {}
             ), enabled=should_check_spellers
         )
+        .with_gha(
+            "zhfst_hash",
+            # Lets the bundle tasks skip deploying identical spellers
+            GithubActionScript(
+                """
+                cd build/tools/spellcheckers
+                echo "::set-output name=zhfst-hash::$(ls *.zhfst | LC_ALL=C sort | xargs sha256sum | sha256sum | cut -d' ' -f1)"
+            """
+            ),
+        )
         .with_named_artifacts(
             "spellers",
             "${HOME}/tasks/${TASK_ID}/lang/build/tools/spellcheckers/*.zhfst",
@@ -116,7 +259,9 @@ def create_spellers_task(dependent_task_id):
     )
 
 
-def create_grammar_checkers_task(dependent_task_id):
+def create_grammar_checkers_task(
+    shared_task_id, dependency_ids, build_tree_from=None, publish_build_tree=False
+):
     should_check_grammar_checkers = CONFIG.tc_config.get(
         'check', {}).get('grammar-checkers', False)
     if should_check_grammar_checkers:
@@ -126,8 +271,13 @@ def create_grammar_checkers_task(dependent_task_id):
     task_suffix = "-grammar-checkers"
 
     return (
-        base_lang_task(task_name)
-        .with_dependencies(dependent_task_id)
+        base_lang_task(
+            task_name,
+            shared_task_id,
+            build_tree_from=build_tree_from,
+            publish_build_tree=publish_build_tree,
+        )
+        .with_dependencies(*dependency_ids)
         .with_gha(
             "build_grammar-checkers",
             GithubAction(
@@ -145,48 +295,70 @@ def create_grammar_checkers_task(dependent_task_id):
     )
 
 
-def base_lang_task(task_name, with_apertium=False):
-    return (
-        linux_build_task(task_name, bundle_dest="lang")
-        .with_additional_repo(
-            "https://github.com/giellalt/giella-core.git",
-            "${HOME}/tasks/${TASK_ID}/giella-core",
-        )
-        .with_additional_repo(
-            "https://github.com/giellalt/giella-shared.git",
-            "${HOME}/tasks/${TASK_ID}/giella-shared",
-        )
-        .with_additional_repo(
-            "https://github.com/giellalt/shared-eng",
-            "${HOME}/tasks/${TASK_ID}/shared-eng"
-        )
-        .with_additional_repo(
-            "https://github.com/giellalt/shared-urj-Cyrl",
-            "${HOME}/tasks/${TASK_ID}/shared-urj-Cyrl"
+def base_lang_task(
+    task_name,
+    shared_task_id,
+    with_apertium=False,
+    build_tree_from=None,
+    publish_build_tree=False,
+):
+    """
+    With `build_tree_from`, restore the `lang/build` tree published by that
+    task before building, so make only rebuilds what it is missing.
+    With `publish_build_tree`, publish this task's own as `lang-build.tar.gz`.
+    """
+    task = (
+        linux_build_task(
+            task_name,
+            bundle_dest="lang",
+            # The image runs lang/install-deps of that taskcluster-gha commit
+            dockerfile=LANG_TOOLCHAIN_DOCKERFILE,
+            dockerfile_args={
+                "TASKCLUSTER_GHA_SHA": remote_head(
+                    "https://github.com/divvun/taskcluster-gha.git", "master"
+                ),
+                "APERTIUM": "true" if with_apertium else "false",
+            },
         )
-        .with_additional_repo(
-            "https://github.com/giellalt/shared-smi",
-            "${HOME}/tasks/${TASK_ID}/shared-smi"
+        .with_curl_artifact_script(
+            shared_task_id, "giellalt-shared.tar.gz", "${HOME}/tasks/${TASK_ID}"
         )
-        .with_additional_repo(
-            "https://github.com/giellalt/shared-mul",
-            "${HOME}/tasks/${TASK_ID}/shared-mul"
+        .with_script(
+            "tar -xzf ${HOME}/tasks/${TASK_ID}/giellalt-shared.tar.gz -C ${HOME}/tasks/${TASK_ID}"
         )
-        .with_gha(
-            "deps",
-            GithubAction(
-                "divvun/taskcluster-gha/lang/install-deps",
-                {"sudo": "false", "apertium": with_apertium},
+        # Documentation changes don't affect the build
+        .with_path_filter("*", "!docs/*", "!*.md")
+    )
+
+    if build_tree_from is not None:
+        task.with_curl_artifact_script(
+            build_tree_from, "lang-build.tar.gz", "${HOME}/tasks/${TASK_ID}", as_gha=True
+        ).with_gha(
+            "restore_build_tree",
+            GithubActionScript(
+                "python3 ${HOME}/tasks/${TASK_ID}/ci/scripts/restore_build_tree.py ${HOME}/tasks/${TASK_ID}/lang-build.tar.gz ${HOME}/tasks/${TASK_ID}/lang"
             ),
         )
-    )
+
+    if publish_build_tree:
+        task.with_late_script(
+            "tar -czf /lang-build.tar.gz -C ${HOME}/tasks/${TASK_ID}/lang build"
+        ).with_artifacts("/lang-build.tar.gz")
+
+    return task
 
 
 def create_bundle_task(os_name, type_, lang_task_id):
+    # The last successful deploy of this bundle, see `gha_check_speller_deploy`
+    deploy_index = f"speller-deploy.{cache_name(os.environ['REPO_NAME'])}.{CONFIG.index_path}.{type_}"
+
     if os_name == "windows-latest":
-        return (
-            windows_task(f"Bundle lang: {type_}")
+        task = (
+            windows_task(f"Bundle lang: {type_}", sparse=BUNDLE_SPARSE_CHECKOUT)
             .with_git()
+            .with_gha(
+                "check_deployed", gha_check_speller_deploy("windows", deploy_index, lang_task_id)
+            )
             .with_curl_artifact_script(
                 lang_task_id, "spellers.tar.gz", extract=True, as_gha=True
             )
@@ -240,12 +412,13 @@ def create_bundle_task(os_name, type_, lang_task_id):
                     },
                 ),
             )
-            .find_or_create(f"bundle.{os_name}_x64_{type_}.{CONFIG.index_path}")
         )
-
-    if os_name == "macos-latest":
-        return (
-            macos_task(f"Bundle lang: {type_}")
+    elif os_name == "macos-latest":
+        task = (
+            macos_task(f"Bundle lang: {type_}", sparse=BUNDLE_SPARSE_CHECKOUT)
+            .with_gha(
+                "check_deployed", gha_check_speller_deploy("macos", deploy_index, lang_task_id)
+            )
             .with_curl_artifact_script(
                 lang_task_id, "spellers.tar.gz", extract=True, as_gha=True
             )
@@ -306,7 +479,36 @@ def create_bundle_task(os_name, type_, lang_task_id):
                     },
                 ),
             )
-            .find_or_create(f"bundle.{os_name}_x64_{type_}.{CONFIG.index_path}")
         )
+    else:
+        raise NotImplementedError
+
+    # Skip everything after the check when the spellers did not change
+    names = list(task.gh_actions)
+    for name in names[names.index("check_deployed") + 1 :]:
+        task.gh_actions[name].with_run_if("${{ steps.check_deployed.outputs.changed }}")
+
+    # Only record the hash of spellers that were actually deployed, or the
+    # next deploy would compare against spellers that never reached pahkat
+    if deploys_enabled():
+        task.with_index_at(deploy_index)
+    return task.find_or_create(f"bundle.{os_name}_x64_{type_}.{CONFIG.index_path}")
+
 
-    raise NotImplementedError
+def gha_check_speller_deploy(os_, deploy_index, lang_task_id):
+    """
+    Compare the hash of the spellers built by `lang_task_id` with the ones of
+    the last successful deploy, indexed at `deploy_index`. Sets the `changed`
+    output that the bundle and deploy steps are conditioned on.
+    """
+    namespace = f"{CONFIG.index_prefix}.{deploy_index}"
+    zhfst_hash = "${{ steps.zhfst_hash.outputs.zhfst-hash }}"
+    if os_ == "windows":
+        script = f"python $env:GITHUB_WORKSPACE/ci/scripts/check_speller_deploy.py {namespace} \"$env:ZHFST_HASH\""
+    else:
+        script = f"python3 $GITHUB_WORKSPACE/ci/scripts/check_speller_deploy.py {namespace} \"$ZHFST_HASH\""
+    return (
+        GithubActionScript(script)
+        .with_env("ZHFST_HASH", zhfst_hash)
+        .with_outputs_from(lang_task_id)
+    )
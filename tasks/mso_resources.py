@@ -1,6 +1,7 @@
 from decisionlib import CONFIG
 from gha import GithubAction, GithubActionScript
 from .common import (
+    linux_build_task,
     macos_task,
     gha_setup,
     gha_pahkat,
@@ -11,6 +12,14 @@ from .common import (
 )
 
 
+# Number of macOS tasks generating patches concurrently. Keep it below the size
+# of the macOS pool so that other repositories can still build.
+MSO_PATCH_LANES = 3
+
+# Installer packages are several GB each, keep a few per worker
+MSO_PKG_CACHE_SIZE = 4
+
+
 def create_mso_resources_tasks():
     create_lang_bundler_task()
 
@@ -31,14 +40,67 @@ def create_lang_bundler_task():
 
 
 def create_mso_patch_gen_task():
-    (
-        macos_task("Generate MSO patches")
-        .with_max_run_time_minutes(600)
-        .with_gha("setup", gha_setup())
-        .with_gha("setup_git", GithubActionScript("""
+    """
+    Refresh the MSO patches. The Office versions listed by `unpatched.js`,
+    which leaves out the ones the repo already has patches for, are shared
+    between `MSO_PATCH_LANES` macOS tasks. A last task, which only needs git,
+    collects their patches into a pull request on Linux.
+    """
+    lane_ids = [
+        create_mso_patch_lane_task(lane, MSO_PATCH_LANES)
+        for lane in range(MSO_PATCH_LANES)
+    ]
+
+    task = linux_build_task("Collect MSO patches")
+    for lane, lane_id in enumerate(lane_ids):
+        task.with_curl_artifact_script(
+            lane_id,
+            "mso-patches.tar.gz",
+            "$HOME/tasks/$TASK_ID",
+            rename=f"mso-patches-{lane}.tar.gz",
+        )
+
+    return (
+        task.with_gha("setup_git", GithubActionScript("""
             git config user.email "feedback@divvun.no"
             git config user.name "divvunbot"
         """))
+        .with_gha("extract_patches", GithubActionScript("""
+            for archive in $HOME/tasks/$TASK_ID/mso-patches-*.tar.gz; do
+                tar -xzf $archive
+            done
+        """))
+        .with_gha("create_commit", GithubActionScript("""
+            git add patches/install
+            git add patches/uninstall
+            git commit -m "[CD] Refresh patches" || exit 0
+            git clean -fdx
+        """))
+        .with_gha("create_mr", GithubAction("peter-evans/create-pull-request@v4", {
+            "branch": "refresh-patches",
+            "title": "Refresh MSO patches",
+            "body": "",
+            "author": "divvunbot <feedback@divvun.no>",
+            "path": "repo",
+        }).with_secret_input("token", "divvun", "github.token"))
+        .find_or_create(f"build.mso_resources.patches.{CONFIG.index_path}")
+    )
+
+
+def create_mso_patch_lane_task(lane: int, lanes: int):
+    """
+    Generate the patches of every `lanes`th unpatched Office version, starting
+    at `lane`, and publish them as `mso-patches.tar.gz`.
+
+    Installer packages are kept in a cache of the worker, keyed by URL and
+    checked against their ETag, so a retried or rerun lane does not download
+    them again.
+    """
+    return (
+        macos_task(f"Generate MSO patches ({lane + 1}/{lanes})")
+        .with_max_run_time_minutes(600)
+        .with_cargo_target_cache("nightly", "apple-darwin")
+        .with_gha("setup", gha_setup())
         .with_gha(
             "install_rustup",
             GithubAction(
@@ -82,16 +144,15 @@ def create_mso_patch_gen_task():
             GithubActionScript(
                 r"""
           mkdir -p mso
-          for MSO_URL in $(node mso-patcher/dist/unpatched.js); do
+          for MSO_URL in $(node mso-patcher/dist/unpatched.js | sort | awk -v lane=$MSO_LANE -v lanes=$MSO_LANES '(NR - 1) % lanes == lane'); do
               export MSO_VER=$(echo $MSO_URL | sed -e 's/https:\/\/officecdn.microsoft.com\/pr\/C1297A47-86C4-4C1F-97FA-950631F94777\/MacAutoupdate\/Microsoft_Office_\(.*\)_Installer\.pkg/\1/')
               echo $MSO_URL
-              wget -O mso.pkg "$MSO_URL"
-              sudo installer -allowUntrusted -verbose -pkg mso.pkg -target / || continue
-              rm -f mso.pkg
+              MSO_PKG=$(python3 $HOME/tasks/$TASK_ID/ci/scripts/cached_download.py "$MSO_URL" "$MSO_PKG_CACHE" --keep $MSO_PKG_CACHE_SIZE)
+              sudo installer -allowUntrusted -verbose -pkg "$MSO_PKG" -target / || continue
               ls /Applications
               sudo mv "/Applications/Microsoft Word.app" mso/$MSO_VER
               sudo chmod -R 777 mso/$MSO_VER
-              ./target/release/divvun-bundler-mso -V $VERSION \
+              $CARGO_TARGET_DIR/release/divvun-bundler-mso -V $VERSION \
               -o patches \
               -R -a "Developer ID Application: The University of Tromso (2K5J2584NX)" -i "Developer ID Installer: The University of Tromso (2K5J2584NX)" \
               -n "$DEVELOPER_ACCOUNT" -p "$DEVELOPER_PASSWORD" \
@@ -102,6 +163,10 @@ def create_mso_patch_gen_task():
           done
           """
             )
+            .with_env("MSO_LANE", str(lane))
+            .with_env("MSO_LANES", str(lanes))
+            .with_env("MSO_PKG_CACHE", f"{CONFIG.macos_cache_root}/mso-pkgs")
+            .with_env("MSO_PKG_CACHE_SIZE", str(MSO_PKG_CACHE_SIZE))
             .with_env("VERSION", "${{ steps.version.outputs.version }}")
             .with_env("SENTRY_DSN", "${{ secrets.divvun.MSO_MACOS_DSN }}")
             .with_env(
@@ -111,18 +176,11 @@ def create_mso_patch_gen_task():
                 "DEVELOPER_PASSWORD", "${{ secrets.divvun.macos.appPasswordMacos }}"
             )
         )
-        .with_gha("create_commit", GithubActionScript("""
-            git add patches/install
-            git add patches/uninstall
-            git commit -m "[CD] Refresh patches" || exit 0
-            git clean -fdx
+        .with_gha("archive_patches", GithubActionScript("""
+            git ls-files -z --modified --others patches | tar --null -T - -czf $TC_TASK_DIR/mso-patches.tar.gz
         """))
-        .with_gha("create_mr", GithubAction("peter-evans/create-pull-request@v4", {
-            "branch": "refresh-patches",
-            "title": "Refresh MSO patches",
-            "body": "",
-            "author": "divvunbot <feedback@divvun.no>",
-            "path": "repo",
-        }).with_secret_input("token", "divvun", "github.token"))
-        .find_or_create(f"build.mso_resources.patches.{CONFIG.index_path}")
+        .with_artifacts("mso-patches.tar.gz")
+        .find_or_create(
+            f"build.mso_resources.patches.lane{lane}.{CONFIG.index_path}"
+        )
     )
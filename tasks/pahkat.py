@@ -11,6 +11,17 @@ from .common import (
     RUST_ENV,
 )
 
+# Builds are reused from the last build of the branch unless one of these,
+# or the crate they build, changed
+PAHKAT_SHARED_PATHS = [
+    ".taskcluster.yml",
+    ".build-config.yml",
+    "Cargo.toml",
+    "Cargo.lock",
+    "pahkat-types/*",
+    "pahkat-client-core/*",
+]
+
 
 def create_pahkat_tasks():
     create_pahkat_uploader_tasks()
@@ -23,7 +34,8 @@ def create_pahkat_tasks():
 def create_pahkat_android_client_task():
     return (
         linux_build_task("Android pahkat client build")
-            .with_apt_install("unzip")
+            .with_android_ndk("r21e")
+            .with_sccache("stable-android")
             .with_gha("setup", gha_setup())
             .with_gha("install_deps", gha_pahkat(["pahkat-uploader"]))
             .with_gha(
@@ -37,11 +49,6 @@ def create_pahkat_android_client_task():
                     },
                 ).with_secret_input("GITHUB_TOKEN", "divvun", "GITHUB_TOKEN"),
             )
-            .with_gha("download_ndk", GithubActionScript("""
-                cd $GITHUB_WORKSPACE
-                curl -o android-ndk.zip https://dl.google.com/android/repository/android-ndk-r21e-linux-x86_64.zip
-                unzip android-ndk.zip
-            """))
             .with_gha(
                 "install_rust",
                 GithubAction(
@@ -56,13 +63,11 @@ def create_pahkat_android_client_task():
             .with_gha("add_targets", GithubActionScript("""
                 rustup target add aarch64-linux-android armv7-linux-androideabi x86_64-linux-android i686-linux-android
             """))
-            .with_gha("install_cargo_ndk", GithubActionScript("""
-                cargo install cargo-ndk
-            """))
+            .with_cargo_ndk()
             .with_gha("build", GithubAction("actions-rs/cargo", {
                 "command": "ndk",
                 "args": "-t armeabi-v7a -t arm64-v8a -o ./lib build -vv --features ffi,prefix --release",
-            }).with_env("ANDROID_NDK_HOME", "$GITHUB_WORKSPACE/android-ndk-r21e").with_cwd("pahkat-client-core"))
+            }).with_cwd("pahkat-client-core"))
             .with_gha("prepare_lib", GithubActionScript("""
                 mkdir -p pahkat-client-core/lib/lib
                 mv pahkat-client-core/lib/arm* pahkat-client-core/lib/lib
@@ -86,6 +91,7 @@ def create_pahkat_android_client_task():
                     },
                 ),
             )
+            .with_path_filter(*PAHKAT_SHARED_PATHS)
             .find_or_create(f"build.pahkat.client_android.{CONFIG.index_path}")
     )
 
@@ -131,6 +137,8 @@ def create_pahkat_prefix_cli_tasks():
         setup_uploader=setup_uploader,
         rename_binary="pahkat-prefix",
         get_features=get_features,
+        vendor_lockfile="Cargo.lock",
+        path_filters=[*PAHKAT_SHARED_PATHS, "pahkat-cli/*"],
     )
 
 
@@ -146,6 +154,8 @@ def create_pahkat_uploader_tasks():
         bin_name="pahkat-uploader",
         env=RUST_ENV,
         setup_uploader=setup_uploader,
+        vendor_lockfile="pahkat-uploader/Cargo.lock",
+        path_filters=["pahkat-uploader/*", "pahkat-types/*"],
     )
 
 
@@ -160,6 +170,8 @@ def create_pahkat_repomgr_tasks():
         bin_name="repomgr",
         env=RUST_ENV,
         setup_uploader=setup_uploader,
+        vendor_lockfile="Cargo.lock",
+        path_filters=[*PAHKAT_SHARED_PATHS, "pahkat-repomgr/*"],
     )
 
 
@@ -168,6 +180,7 @@ def create_pahkat_service_windows_task():
         windows_task("Pahkat service (Windows)")
         .with_cmake()
         .with_rustup()
+        .with_sccache("stable-i686-pc-windows-msvc")
         .with_gha("setup", gha_setup())
         .with_gha(
             "version",
@@ -309,6 +322,7 @@ def create_pahkat_service_windows_task():
                 },
             ),
         )
+        .with_path_filter(*PAHKAT_SHARED_PATHS, "pahkat-rpc/*")
         .find_or_create(f"build.pahkat.service_windows.{CONFIG.index_path}")
     )
 
@@ -328,4 +342,6 @@ def create_pahkat_windows_cli_task():
         rename_binary="pahkat-windows",
         get_features=get_features,
         only_os=["windows"],
+        vendor_lockfile="Cargo.lock",
+        path_filters=[*PAHKAT_SHARED_PATHS, "pahkat-cli/*"],
     )
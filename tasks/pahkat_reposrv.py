@@ -7,6 +7,7 @@ from .common import linux_build_task
 def create_pahkat_reposrv_task(tag_name: str):
     task = (
         linux_build_task("Pahkat reposrv build")
+        .with_sccache("stable-x86_64-unknown-linux-gnu")
         .with_gha(
             "Install rust",
             GithubAction(
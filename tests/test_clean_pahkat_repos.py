@@ -0,0 +1,153 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+import clean_pahkat_repos
+
+
+class FakePaginator:
+    def __init__(self, objects, page_size):
+        self.objects = objects
+        self.page_size = page_size
+
+    def paginate(self, Bucket, Prefix):
+        keys = sorted(k for k in self.objects if k.startswith(Prefix))
+        for i in range(0, len(keys), self.page_size):
+            yield {
+                "Contents": [
+                    {"Key": k, "Size": self.objects[k]}
+                    for k in keys[i : i + self.page_size]
+                ]
+            }
+
+
+class FakeS3:
+    """Enough of an S3 client for the reconciler, with paged listings"""
+
+    def __init__(self, objects, page_size=1000, failing=()):
+        self.objects = dict(objects)
+        self.page_size = page_size
+        self.failing = set(failing)
+        self.batch_sizes = []
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return FakePaginator(self.objects, self.page_size)
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [o["Key"] for o in Delete["Objects"]]
+        self.batch_sizes.append(len(keys))
+        errors = []
+        for key in keys:
+            if key in self.failing:
+                errors.append({"Key": key, "Code": "AccessDenied"})
+            else:
+                self.objects.pop(key, None)
+        return {"Errors": errors}
+
+
+INDEX_TOML = """
+[[release]]
+version = "1.0.0"
+
+[[release.target]]
+platform = "windows"
+
+[release.target.payload]
+url = "https://pahkat.uit.no/artifacts/%s"
+"""
+
+
+class TestCleanPahkatRepos(unittest.TestCase):
+    def setUp(self):
+        self.index = tempfile.TemporaryDirectory()
+        self.write_index("main/packages/kept/index.toml", INDEX_TOML % "kept.exe")
+        self.write_index("main/packages/empty/index.toml", 'name = "empty"\n')
+        self.write_index(".git/ignored.toml", INDEX_TOML % "orphan-0.exe")
+
+    def tearDown(self):
+        self.index.cleanup()
+
+    def write_index(self, path, content):
+        path = os.path.join(self.index.name, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def bucket(self, orphans, **kwargs):
+        objects = {"pahkat/artifacts/": 0, "pahkat/artifacts/kept.exe": 10}
+        objects["pahkat/artifacts/giellakbd-android-jnilibs.zip"] = 10
+        for i in range(orphans):
+            objects["pahkat/artifacts/orphan-%d.exe" % i] = 10
+        return FakeS3(objects, **kwargs)
+
+    def git(self, *args):
+        subprocess.run(
+            ["git", "-C", self.index.name, *args], check=True, capture_output=True
+        )
+
+    def commit(self):
+        self.git("add", "-A")
+        self.git(
+            "-c", "user.name=test", "-c", "user.email=test@example.com",
+            "commit", "-q", "-m", "update",
+        )
+
+    def test_referenced_packages(self):
+        rows, parsed = clean_pahkat_repos.referenced_packages(self.index.name, workers=1)
+        self.assertEqual(rows, [("/artifacts/kept.exe", "main/packages/kept/index.toml")])
+        self.assertEqual(parsed, 2)
+
+    def test_referenced_packages_state(self):
+        state = os.path.join(self.index.name, ".state")
+        self.git("init", "-q")
+        self.commit()
+        rows, parsed = clean_pahkat_repos.referenced_packages(self.index.name, state, 1)
+        self.assertEqual(parsed, 2)
+
+        self.write_index("main/packages/new/index.toml", INDEX_TOML % "new.exe")
+        os.remove(os.path.join(self.index.name, "main/packages/kept/index.toml"))
+        self.commit()
+        rows, parsed = clean_pahkat_repos.referenced_packages(self.index.name, state, 1)
+        self.assertEqual(rows, [("/artifacts/new.exe", "main/packages/new/index.toml")])
+        self.assertEqual(parsed, 1)
+
+        rows, parsed = clean_pahkat_repos.referenced_packages(self.index.name, state, 1)
+        self.assertEqual(rows, [("/artifacts/new.exe", "main/packages/new/index.toml")])
+        self.assertEqual(parsed, 0)
+
+    def test_deletes_orphans_across_pages(self):
+        client = self.bucket(2500, page_size=1000)
+        errors = clean_pahkat_repos.reconcile(client, self.index.name, workers=1)
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(client.batch_sizes), [500, 1000, 1000])
+        self.assertEqual(
+            set(client.objects),
+            {
+                "pahkat/artifacts/",
+                "pahkat/artifacts/kept.exe",
+                "pahkat/artifacts/giellakbd-android-jnilibs.zip",
+            },
+        )
+
+    def test_dry_run(self):
+        client = self.bucket(3)
+        clean_pahkat_repos.reconcile(
+            client, self.index.name, dry_run=True, workers=1
+        )
+        self.assertEqual(client.batch_sizes, [])
+        self.assertEqual(len(client.objects), 6)
+
+    def test_reports_failed_deletions(self):
+        client = self.bucket(3, failing=["pahkat/artifacts/orphan-1.exe"])
+        errors = clean_pahkat_repos.reconcile(client, self.index.name, workers=1)
+        self.assertEqual(errors, [("pahkat/artifacts/orphan-1.exe", "AccessDenied")])
+        self.assertIn("pahkat/artifacts/orphan-1.exe", client.objects)
+
+
+if __name__ == "__main__":
+    unittest.main()
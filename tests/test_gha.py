@@ -99,6 +99,22 @@ class TestGithubActionGeneration(unittest.TestCase):
         self.assertEqual(payload["env"]["TEST_ENV"], "test_value")
 
 
+class TestLatestIndexPath(unittest.TestCase):
+    def latest_index_path(self, repo_name):
+        os.environ["REPO_NAME"] = repo_name
+        return decisionlib.latest_index_path("lang.build")
+
+    def test_repo_in_path(self):
+        self.assertEqual(
+            self.latest_index_path("lang-sme"), "latest.lang-sme.lang.build"
+        )
+
+    def test_repos_differ(self):
+        self.assertNotEqual(
+            self.latest_index_path("lang-sme"), self.latest_index_path("lang-smj")
+        )
+
+
 class BaseRunnerTest(unittest.TestCase):
     def setUp(self):
         self.outputs = {
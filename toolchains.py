@@ -0,0 +1,95 @@
+"""
+Toolchains downloaded by the tasks, per platform.
+
+On Windows these are `generic-worker` mounts: the worker downloads them before
+the task starts and keeps them in its cache. Pinning their `sha256` lets the
+cache be reused across tasks, so URLs must point to a fixed version. Run
+`scripts/update_toolchain_hashes.py --write` after changing one.
+
+On Linux they are downloaded by the task's script instead, see
+`DockerWorkerTask.with_android_ndk`, and only have a url, sha256 and format.
+
+Each toolchain has:
+    - url: where to download it from
+    - sha256: hash of the download, checked by the worker. Toolchains without
+      one are mounted from the first download of their URL, kept by
+      `decisionlib.toolchain_mirror_task`, which prints the hash to pin.
+    - format: archive format, or "file" to mount the download as is
+    - path: where to mount it, relative to the task's home directory
+    - bin: directories to add to `PATH`, relative to the task's home directory
+    - repack: optional, set for archives that are slow to extract, such as
+      tar.bz2. They are then recompressed once to tar.gz by an indexed task
+      and mounted from its artifact.
+"""
+
+SCCACHE_VERSION = "v0.8.1"
+
+TOOLCHAINS = {
+    "win": {
+        "git": {
+            "url": "https://github.com/git-for-windows/git/releases/download/v2.34.1.windows.1/Git-2.34.1-64-bit.tar.bz2",
+            "sha256": None,
+            "format": "tar.bz2",
+            "repack": True,
+            "path": "git",
+            "bin": ["git\\cmd", "git\\bin", "git\\mingw64\\bin"],
+        },
+        "cmake": {
+            "url": "https://github.com/Kitware/CMake/releases/download/v3.23.1/cmake-3.23.1-windows-x86_64.zip",
+            "sha256": None,
+            "format": "zip",
+            "path": "cmake",
+            "bin": ["cmake\\cmake-3.23.1-windows-x86_64\\bin"],
+        },
+        "curl": {
+            "url": "https://curl.se/windows/dl-8.3.0_1/curl-8.3.0_1-win64-mingw.zip",
+            "sha256": None,
+            "format": "zip",
+            "path": "curl",
+            "bin": ["curl\\curl-8.3.0_1-win64-mingw\\bin"],
+        },
+        "rustup": {
+            "url": "https://static.rust-lang.org/rustup/archive/1.27.1/x86_64-pc-windows-msvc/rustup-init.exe",
+            "sha256": None,
+            "format": "file",
+            "path": "rustup-init.exe",
+            "bin": [".cargo\\bin"],
+        },
+        # The NuGet package is a zip of a ready to use Python, with pip
+        "python3": {
+            "url": "https://www.nuget.org/api/v2/package/python/3.10.11",
+            "sha256": None,
+            "format": "zip",
+            "path": "python3",
+            "bin": ["python3\\tools", "python3\\tools\\Scripts"],
+        },
+        "ant": {
+            "url": "https://archive.apache.org/dist/ant/binaries/apache-ant-1.10.0-bin.zip",
+            "sha256": None,
+            "format": "zip",
+            "path": "ant",
+            "bin": ["ant\\apache-ant-1.10.0\\bin"],
+        },
+        "sccache": {
+            "url": f"https://github.com/mozilla/sccache/releases/download/{SCCACHE_VERSION}/sccache-{SCCACHE_VERSION}-x86_64-pc-windows-msvc.tar.gz",
+            "sha256": None,
+            "format": "tar.gz",
+            "path": "sccache",
+            "bin": [f"sccache\\sccache-{SCCACHE_VERSION}-x86_64-pc-windows-msvc"],
+        },
+    },
+    "linux": {
+        # Linux archives lost their architecture suffix in r23
+        "android-ndk-r21e": {
+            "url": "https://dl.google.com/android/repository/android-ndk-r21e-linux-x86_64.zip",
+            "sha256": None,
+            "format": "zip",
+        },
+        "android-ndk-r27c": {
+            "url": "https://dl.google.com/android/repository/android-ndk-r27c-linux.zip",
+            "sha256": None,
+            "format": "zip",
+        },
+    },
+}
+